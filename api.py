@@ -1,24 +1,43 @@
-import datetime
+import asyncio
 import os
 import secrets
+import time
 from contextlib import asynccontextmanager
-from typing import List, Generic, TypeVar, Type
+from typing import List, Generic, TypeVar, Type, Callable, Optional, Tuple, Literal
 
 import logging
 from dotenv import load_dotenv, set_key
-from fastapi import FastAPI, HTTPException, Depends, APIRouter
+from fastapi import FastAPI, HTTPException, Depends, APIRouter, Request, Query
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import ValidationError, TypeAdapter
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import Session, select
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import FileResponse
-from starlette.staticfiles import StaticFiles
-
-from config import IFACE, WEBUI_ROOT_DIR, ENV_FILE
-from data.database import init_db, get_session, check_db
-from models import Device, Gateway, Tag
-from neigh import ipv4_to_mac, get_ipv6_neighs
-from utils import daemon, broadcast_job, scheduler
+from starlette.responses import PlainTextResponse, StreamingResponse, Response, JSONResponse
+
+from bulk_io import iter_rows, RowError, format_validation_error, to_csv, to_ndjson
+from config import IFACE, ENV_FILE, RA_SCHEDULE_MODE, RS_LISTENER, GW_PROBE, BULK_CHUNK_SIZE, \
+    LIST_MAX_LIMIT, EVENT_KEEPALIVE
+from data.database import init_db, get_session, check_db, engine, get_revision
+from events import event_bus
+from gateway_health import gateway_prober
+from ha import ha, NotLeaderError
+from history import history
+from metrics import registry, api_request_seconds
+from models import Device, Gateway, Tag, IPv4BulkRequest, PrefixUpdate
+from neigh import ipv4_to_mac, get_ipv6_neighs, neighbor_cache, ipv4_resolver
+from plan import plan
+from prefix_watch import prefix_watcher, to_prefix
+from presence import presence
+from rawsock import senders
+from rs_listener import rs_listener
+from startup_profile import startup
+from utils import daemon, broadcast_job, scheduler, retarget_queue, reschedule_broadcast, \
+    trigger_now as trigger_broadcast
+from webui_assets import asset_index
 from webui_manager import WebUIManager
 
 logger = logging.getLogger(__name__)
@@ -47,15 +66,59 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
             headers={"WWW-Authenticate": "Bearer"},
         )
     return token
+async def verify_stream_token(request: Request, token: Optional[str] = None):
+    """同 verify_token；浏览器的 EventSource 无法设置请求头，因此也接受 ?token= 查询参数"""
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if token != DEFAULT_TOKEN and not (scheme.lower() == "bearer" and credentials == DEFAULT_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 api_router = APIRouter(dependencies=[Depends(verify_token)])
 # --- 泛型 CRUD 服务 ---
 T = TypeVar("T")
 class CRUDService(Generic[T]):
-    def __init__(self, model: Type[T], id_field: str):
+    def __init__(self, model: Type[T], id_field: str, on_change: Optional[Callable] = None,
+                 on_bulk_change: Optional[Callable] = None):
         self.model = model
         self.id_field = id_field
+        # 提交后的变更钩子：on_change(action, id_val, obj)
+        self.on_change = on_change
+        # 批量导入提交后的变更钩子：on_bulk_change(objs)，未设置时逐行调用 on_change
+        self.on_bulk_change = on_bulk_change
+        self._adapter = TypeAdapter(List[model])
+        # 已序列化的列表响应：查询参数 -> (JSON, 下一页游标)，表修订号变化时清空
+        self._page_cache: dict = {}
+        self._page_cache_rev = None
+
+    def _notify(self, action: str, id_val, obj):
+        if self.on_change:
+            try:
+                # 网关发生变化的设备：合并后由旧网关撤回、新网关立即通告
+                retarget_queue.submit(self.on_change(action, id_val, obj))
+            except Exception as e:
+                logger.error(f"变更钩子执行失败: {e}")
+
+    def _notify_bulk(self, objs: List[T]):
+        if self.on_bulk_change is None:
+            for obj in objs:
+                self._notify("update", getattr(obj, self.id_field), obj)
+            return
+        try:
+            retarget_queue.submit(self.on_bulk_change(objs))
+        except Exception as e:
+            logger.error(f"变更钩子执行失败: {e}")
+
+    def _validate(self, obj: T):
+        """表模型作为请求体时 FastAPI 不执行字段校验，写入前补做一次，非法时返回 422"""
+        try:
+            self.model.model_validate(obj.model_dump())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False, include_context=False))
 
     def create(self, obj: T, session: Session) -> T:
+        self._validate(obj)
         # 检查是否已存在
         id_val = getattr(obj, self.id_field)
         if id_val is not None:
@@ -66,12 +129,145 @@ class CRUDService(Generic[T]):
         session.add(obj)
         session.commit()
         session.refresh(obj)
+        self._notify("create", getattr(obj, self.id_field), obj)
         return obj
 
+    def bulk_upsert(self, rows: List[Tuple[int, dict]], session: Session) -> List[dict]:
+        """
+        在当前事务中以 executemany 写入一批已校验的行（主键冲突则更新）。
+        整批失败时逐行重试，返回出错行的错误列表。
+        """
+        table = self.model.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.id_field],
+            set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name != self.id_field},
+        )
+        conn = session.connection()
+        try:
+            with conn.begin_nested():
+                conn.execute(stmt, [row for _, row in rows])
+            return []
+        except Exception:
+            errors = []
+            for i, row in rows:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(stmt, [row])
+                except Exception as e:
+                    errors.append({"row": i, "error": str(getattr(e, "orig", e))})
+            return errors
+
+    async def bulk_import(self, request: Request, session: Session) -> dict:
+        """流式解析请求体，所有行在同一事务中写入，返回逐行错误报告"""
+        total = 0
+        errors = []
+        chunk: List[Tuple[int, dict]] = []
+        written: List[Tuple[int, dict]] = []
+
+        async def flush():
+            failed = await run_in_threadpool(self.bulk_upsert, chunk, session)
+            errors.extend(failed)
+            failed_rows = {e["row"] for e in failed}
+            written.extend(r for r in chunk if r[0] not in failed_rows)
+            chunk.clear()
+
+        async for i, row in iter_rows(request.stream(), request.headers.get("content-type")):
+            if i:
+                total += 1
+            if isinstance(row, RowError):
+                errors.append({"row": i, "error": str(row)})
+                continue
+            try:
+                obj = self.model.model_validate(row)
+            except ValidationError as e:
+                errors.append({"row": i, "error": format_validation_error(e)})
+                continue
+            chunk.append((i, obj.model_dump()))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
+
+        await run_in_threadpool(session.commit)
+        # 导入的全部行一次性修补通告计划
+        self._notify_bulk([self.model(**row) for _, row in written])
+        return {"total": total, "upserted": len(written), "failed": len(errors), "errors": errors}
+
+    def export(self, fmt: str):
+        """流式导出全部行，按批从数据库读取，不在内存中构造完整列表"""
+        def rows():
+            with Session(engine) as session:
+                statement = select(self.model).execution_options(yield_per=BULK_CHUNK_SIZE)
+                for obj in session.exec(statement):
+                    yield obj.model_dump()
+
+        if fmt == "csv":
+            return StreamingResponse(to_csv(rows(), list(self.model.model_fields)), media_type="text/csv")
+        return StreamingResponse(to_ndjson(rows()), media_type="application/x-ndjson")
+
     def get_all(self, session: Session) -> List[T]:
         statement = select(self.model)
         return list(session.exec(statement).all())
 
+    def get_page(self, session: Session, cursor: Optional[str] = None, limit: Optional[int] = None,
+                 tag_id: Optional[int] = None, alias: Optional[str] = None,
+                 mac_prefix: Optional[str] = None) -> Tuple[List[T], Optional[str]]:
+        """按主键游标分页并过滤，返回 (本页数据, 下一页游标)"""
+        id_column = getattr(self.model, self.id_field)
+        statement = select(self.model)
+        if tag_id is not None and hasattr(self.model, "tag_id"):
+            statement = statement.where(self.model.tag_id == tag_id)
+        if alias:
+            statement = statement.where(self.model.alias.contains(alias, autoescape=True))
+        if mac_prefix:
+            statement = statement.where(id_column.startswith(mac_prefix, autoescape=True))
+        if cursor is not None or limit is not None:
+            statement = statement.order_by(id_column)
+        if cursor is not None:
+            try:
+                cursor_val = id_column.type.python_type(cursor)
+            except (TypeError, ValueError):
+                raise HTTPException(400, "invalid cursor")
+            statement = statement.where(id_column > cursor_val)
+        if limit is not None:
+            statement = statement.limit(limit + 1)
+
+        rows = list(session.exec(statement).all())
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(getattr(rows[-1], self.id_field))
+        return rows, next_cursor
+
+    def list_response(self, request: Request, session: Session, **params) -> Response:
+        """
+        带条件请求的列表响应：ETag 为表修订号，If-None-Match 命中时直接返回 304，
+        不查询数据也不序列化；未命中时复用同一修订号下已序列化的结果。
+        """
+        rev = get_revision(self.model.__tablename__, session)
+        etag = f'W/"{self.model.__tablename__}-{rev}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+
+        if self._page_cache_rev != rev:
+            self._page_cache = {}
+            self._page_cache_rev = rev
+        key = tuple(sorted(params.items()))
+        cached = self._page_cache.get(key)
+        if cached is None:
+            rows, next_cursor = self.get_page(session, **params)
+            cached = (self._adapter.dump_json(rows), next_cursor)
+            if len(self._page_cache) >= 64:
+                self._page_cache.clear()
+            self._page_cache[key] = cached
+        body, next_cursor = cached
+        if next_cursor is not None:
+            headers["X-Next-Cursor"] = next_cursor
+        return Response(body, media_type="application/json", headers=headers)
+
     def get_one(self, id_val, session: Session) -> T:
         obj = session.get(self.model, id_val)
         if not obj:
@@ -86,10 +282,12 @@ class CRUDService(Generic[T]):
         for key, value in update_data.items():
             if value is not None:  # 只更新非 None 的字段
                 setattr(obj, key, value)
+        self._validate(obj)
 
         session.add(obj)
         session.commit()
         session.refresh(obj)
+        self._notify("update", id_val, obj)
         return obj
 
     def delete(self, id_val, session: Session):
@@ -97,34 +295,118 @@ class CRUDService(Generic[T]):
         if not obj:
             raise HTTPException(404, "Item not found")
 
+        snapshot = self.model(**obj.model_dump())
         session.delete(obj)
         session.commit()
+        self._notify("delete", id_val, snapshot)
         return {"message": "deleted"}
 
 
 # --- 实例化服务 ---
-tag_service = CRUDService(Tag, "tag_id")
-device_service = CRUDService(Device, "mac")
-gateway_service = CRUDService(Gateway, "mac")
+def sync_interfaces():
+    """按标签使用的网卡启动/停止各网卡上的 RS 监听与网关健康检查线程"""
+    ifaces = plan.interfaces()
+    if RS_LISTENER:
+        rs_listener.sync(ifaces)
+    if GW_PROBE:
+        gateway_prober.sync(ifaces)
+
+
+def on_ha_promote():
+    """备机接管：按数据库重新加载通告计划（主机运行期间的修改），并立即发送一轮 RA"""
+    plan.load()
+    sync_interfaces()
+    reschedule_broadcast()
+    if RA_SCHEDULE_MODE == "burst":
+        daemon()
+    else:
+        trigger_broadcast()
+
+
+def on_tag_change(action, id_val, obj=None):
+    changes = plan.on_change(action, id_val, obj)
+    sync_interfaces()
+    reschedule_broadcast()
+    return changes
+
+
+tag_service = CRUDService(Tag, "tag_id", on_change=on_tag_change)
+device_service = CRUDService(Device, "mac", on_change=plan.on_change, on_bulk_change=plan.on_bulk_change)
+gateway_service = CRUDService(Gateway, "mac", on_change=plan.on_change, on_bulk_change=plan.on_bulk_change)
 
 # --- FastAPI 应用 ---
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    await WebUIManager().ensure_webui()
-    init_db()
-    daemon()
-    scheduler.start()
+    if not plan.version:
+        # 通过 app.py 启动时已提前加载计划并发送首轮 RA
+        with startup.phase("初始化数据库"):
+            init_db()
+        with startup.phase("加载通告计划"):
+            plan.load()
+        ha.acquire()
+        if RA_SCHEDULE_MODE == "burst":
+            with startup.phase("首轮 RA"):
+                daemon()
+    reschedule_broadcast()
+    with startup.phase("启动调度器与监听"):
+        scheduler.start()
+        if presence.enabled:
+            neighbor_cache.on_reachable = presence.seen
+        neighbor_cache.start()
+        prefix_watcher.start()
+        if RS_LISTENER:
+            rs_listener.start(plan.interfaces())
+        if GW_PROBE:
+            gateway_prober.start(plan.interfaces())
+        ha.on_promote = on_ha_promote
+        ha.start()
+    # RA 已开始发送后再加载本地 WebUI，并在后台检查更新，离线时不会拖慢启动
+    with startup.phase("WebUI 索引"):
+        await run_in_threadpool(asset_index.load)
+    webui_task = asyncio.create_task(WebUIManager().ensure_webui())
+    startup.report()
     yield
+    webui_task.cancel()
+    ha.stop()
+    gateway_prober.stop()
+    rs_listener.stop()
+    prefix_watcher.stop()
+    neighbor_cache.stop()
     scheduler.shutdown()
+    retarget_queue.flush()
+    senders.close()
     check_db()
 app = FastAPI(lifespan=lifespan)
 
+@app.exception_handler(NotLeaderError)
+async def not_leader_handler(_request: Request, exc: NotLeaderError):
+    """备机不接受修改，客户端应改为访问主机"""
+    return JSONResponse(status_code=503, content={"detail": str(exc), "leader": exc.holder or None})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    api_request_seconds.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=response.status_code
+    )
+    return response
+
+@app.get("/metrics", dependencies=[Depends(verify_token)])
+def metrics():
+    """Prometheus 文本格式指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @api_router.get("/verify_token")
 def v():
     return 'OK'
@@ -154,20 +436,86 @@ def check_broadcast_job():
 @api_router.get("/broadcast/trigger_now")
 def trigger_now():
     if broadcast_job:
-        broadcast_job.modify(next_run_time=datetime.datetime.now())
+        trigger_broadcast()
         return {"status": "success", "message": "Broadcast triggered"}
     raise HTTPException(status_code=500, detail="Job not found")
+@api_router.get("/ha/")
+def ha_status():
+    """主备状态：本实例角色、纪元号及数据库中的当前租约"""
+    return ha.to_dict()
+
+@api_router.get("/rs/")
+def rs_stats():
+    """RS 应答统计，含 RS -> RA 延迟"""
+    return rs_listener.stats.to_dict()
+
+@api_router.get("/plan/check")
+def check_plan(repair: bool = False, session: Session = Depends(get_session)):
+    """对比内存通告计划与数据库，repair=true 时不一致则重新加载"""
+    result = plan.verify(session)
+    if repair and not result["consistent"]:
+        plan.load(session)
+        sync_interfaces()
+        reschedule_broadcast()
+        result["repaired"] = True
+    return result
+
 # --- 网络扫描路由 ---
 @api_router.get("/neighbors/")
-def list_neighbors():
-    return get_ipv6_neighs()
+def list_neighbors(iface: str = IFACE):
+    return get_ipv6_neighs(iface)
+
 
+@api_router.get("/events/stats")
+def events_stats():
+    """实时事件流的客户端数、已发布事件数及排队中的事件数"""
+    return event_bus.stats()
 
+
+@api_router.get("/presence/")
+def presence_stats():
+    """在线/离线设备数及最近一轮发送/跳过的设备数"""
+    return presence.to_dict()
+
+
+@api_router.get("/neighbors/stats")
+def neighbors_stats():
+    """邻居表缓存的条目数、事件速率与新鲜度"""
+    return neighbor_cache.stats()
+
+
+# --- 前缀路由 ---
+@api_router.get("/prefix/")
+def get_prefix():
+    """当前通告的前缀及仍在以 preferred lifetime 0 通告的旧前缀（剩余秒数）"""
+    return prefix_watcher.to_dict()
+
+
+@api_router.put("/prefix/")
+def update_prefix(req: PrefixUpdate):
+    """切换前缀（供 DHCPv6-PD 等外部脚本调用），立即向所有设备通告新前缀并弃用旧前缀"""
+    try:
+        prefix = to_prefix(req.prefix)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"changed": prefix_watcher.apply(prefix), **prefix_watcher.to_dict()}
+
+
+# 主动 ARP 会阻塞，使用同步函数让 FastAPI 放到线程池执行
 @api_router.get("/ipv4/mac/")
-async def get_ipv4_mac(ip: str):
+def get_ipv4_mac(ip: str):
     return ipv4_to_mac(iface=IFACE, ip=ip)
 
 
+@api_router.post("/ipv4/mac/bulk")
+def get_ipv4_macs(req: IPv4BulkRequest):
+    """批量解析 IPv4 -> MAC，可传入地址列表和/或一个网段（如 192.168.1.0/24）"""
+    try:
+        return ipv4_resolver.resolve_bulk(req.ips, req.cidr)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
 # --- Tag 路由 ---
 @api_router.post("/tags/", response_model=Tag)
 def create_tag(tag: Tag, session: Session = Depends(get_session)):
@@ -175,8 +523,11 @@ def create_tag(tag: Tag, session: Session = Depends(get_session)):
 
 
 @api_router.get("/tags/", response_model=List[Tag])
-def list_tags(session: Session = Depends(get_session)):
-    return tag_service.get_all(session)
+def list_tags(request: Request, cursor: Optional[str] = None,
+              limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+              alias: Optional[str] = None, session: Session = Depends(get_session)):
+    """支持游标分页（下一页游标见 X-Next-Cursor 响应头）、过滤及 ETag 条件请求"""
+    return tag_service.list_response(request, session, cursor=cursor, limit=limit, alias=alias)
 
 
 @api_router.put("/tags/{tag_id}", response_model=Tag)
@@ -196,8 +547,50 @@ def create_device(device: Device, session: Session = Depends(get_session)):
 
 
 @api_router.get("/devices/", response_model=List[Device])
-def list_devices(session: Session = Depends(get_session)):
-    return device_service.get_all(session)
+def list_devices(request: Request, cursor: Optional[str] = None,
+                 limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+                 tag_id: Optional[int] = None, alias: Optional[str] = None, mac_prefix: Optional[str] = None,
+                 advertised: bool = False, session: Session = Depends(get_session)):
+    """
+    支持游标分页（下一页游标见 X-Next-Cursor 响应头）、过滤及 ETag 条件请求。
+    advertised=true 时每个设备附带 last_advertised_ago（距上次成功发送 RA 的秒数），该结果随时间变化，不做条件请求
+    """
+    if not advertised:
+        return device_service.list_response(request, session, cursor=cursor, limit=limit,
+                                            tag_id=tag_id, alias=alias, mac_prefix=mac_prefix)
+    rows, next_cursor = device_service.get_page(session, cursor=cursor, limit=limit,
+                                                tag_id=tag_id, alias=alias, mac_prefix=mac_prefix)
+    headers = {"Cache-Control": "no-store"}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return JSONResponse([{**row.model_dump(), "last_advertised_ago": history.last_advertised_ago(row.mac)}
+                         for row in rows], headers=headers)
+
+
+@api_router.get("/devices/{mac}/history")
+def device_history(mac: str):
+    """设备最近的 RA 发送记录（最新的在前）：时间、网关、DNS、lifetime、触发原因及是否成功"""
+    try:
+        return history.query(mac)
+    except ValueError:
+        raise HTTPException(400, "invalid MAC address")
+
+
+@api_router.get("/history/stats")
+def history_stats():
+    """RA 历史缓冲区的设备数、记录数及内存占用"""
+    return history.stats()
+
+
+@api_router.post("/devices/bulk")
+async def import_devices(request: Request, session: Session = Depends(get_session)):
+    """批量导入设备：JSON 数组、NDJSON 或 CSV，按 MAC 覆盖已有设备"""
+    return await device_service.bulk_import(request, session)
+
+
+@api_router.get("/devices/export")
+def export_devices(format: Literal["ndjson", "csv"] = "ndjson"):
+    return device_service.export(format)
 
 
 @api_router.put("/devices/{mac}", response_model=Device)
@@ -211,14 +604,36 @@ def delete_device(mac: str, session: Session = Depends(get_session)):
 
 
 # --- Gateway 路由 ---
+@api_router.get("/gateways/health")
+def gateways_health():
+    """网关健康检查状态"""
+    return gateway_prober.to_dict()
+
+
 @api_router.post("/gateways/", response_model=Gateway)
 def create_gateway(gw: Gateway, session: Session = Depends(get_session)):
     return gateway_service.create(gw, session)
 
 
 @api_router.get("/gateways/", response_model=List[Gateway])
-def list_gateways(session: Session = Depends(get_session)):
-    return gateway_service.get_all(session)
+def list_gateways(request: Request, cursor: Optional[str] = None,
+                  limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+                  tag_id: Optional[int] = None, alias: Optional[str] = None, mac_prefix: Optional[str] = None,
+                  session: Session = Depends(get_session)):
+    """支持游标分页（下一页游标见 X-Next-Cursor 响应头）、过滤及 ETag 条件请求"""
+    return gateway_service.list_response(request, session, cursor=cursor, limit=limit,
+                                         tag_id=tag_id, alias=alias, mac_prefix=mac_prefix)
+
+
+@api_router.post("/gateways/bulk")
+async def import_gateways(request: Request, session: Session = Depends(get_session)):
+    """批量导入网关：JSON 数组、NDJSON 或 CSV，按 MAC 覆盖已有网关"""
+    return await gateway_service.bulk_import(request, session)
+
+
+@api_router.get("/gateways/export")
+def export_gateways(format: Literal["ndjson", "csv"] = "ndjson"):
+    return gateway_service.export(format)
 
 
 @api_router.put("/gateways/{mac}", response_model=Gateway)
@@ -232,21 +647,40 @@ def delete_gateway(mac: str, session: Session = Depends(get_session)):
 
 app.include_router(api_router, prefix="/api")
 
-if (WEBUI_ROOT_DIR / "assets").exists():
-    app.mount("/assets", StaticFiles(directory=str(WEBUI_ROOT_DIR / "assets")), name="assets")
+@app.get("/api/events/", dependencies=[Depends(verify_stream_token)])
+async def stream_events(types: Optional[str] = None):
+    """
+    以 SSE 推送实时事件：neighbor（邻居出现/消失）、ra（RS/在线检测触发的单设备发送及结果）、
+    retarget（设备网关变化）、gateway（网关健康状态）、presence、prefix，以及每轮发送的汇总 pass。
+    types 为逗号分隔的事件类型过滤。客户端消费过慢时丢弃最旧的事件，并推送 lagged 事件提示重新同步。
+    """
+    subscriber = event_bus.subscribe(set(types.split(",")) if types else None)
+    if subscriber is None:
+        raise HTTPException(503, "Too many event stream clients")
+
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                batch = await subscriber.get(EVENT_KEEPALIVE)
+                yield b"".join(batch) if batch else b": keepalive\n\n"
+        finally:
+            event_bus.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/{full_path:path}")
-async def serve_spa(full_path: str):
-    """处理所有其他路由，返回 index.html 或静态文件"""
-    file_path = WEBUI_ROOT_DIR / full_path
-
-    # 如果是文件且存在，直接返回
-    if file_path.is_file():
-        return FileResponse(file_path)
+async def serve_spa(full_path: str, request: Request):
+    """处理所有其他路由，从内存索引返回静态文件或 index.html"""
+    # 如果是已索引的文件，直接返回
+    response = asset_index.response(full_path, request.headers)
+    if response is not None:
+        return response
 
     # 否则返回 index.html（用于 SPA 路由）
-    index_path = WEBUI_ROOT_DIR / "index.html"
-    if index_path.exists():
-        return FileResponse(index_path)
+    response = asset_index.response("index.html", request.headers)
+    if response is not None:
+        return response
 
     return {"error": "WebUI not found"}
\ No newline at end of file
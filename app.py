@@ -1,13 +1,14 @@
+# 最先导入，作为启动计时的起点
+from startup_profile import startup
+
+import argparse
 import logging
 import os
+import socket
 import sys
 from logging.handlers import RotatingFileHandler
 
-import uvicorn
-from rich.logging import RichHandler
-from scapy.all import conf as scapy_conf
-from scapy.interfaces import get_if_list
-from config import IFACE
+from config import IFACE, RA_SCHEDULE_MODE
 
 
 def setup_logging():
@@ -20,12 +21,10 @@ def setup_logging():
     root_logger.setLevel(logging.INFO)
 
     if not root_logger.handlers:
-        # --- 控制台：使用 Rich 渲染 ---
-        console_handler = RichHandler(
-            level=logging.INFO,
-            rich_tracebacks=True,
-            markup=True  # 允许在日志中使用 [bold red]text[/] 这种标记
-        )
+        # --- 控制台：首轮 RA 发出前先用标准输出，之后再换成 Rich ---
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(message)s', '%H:%M:%S'))
         root_logger.addHandler(console_handler)
 
         file_handler = RotatingFileHandler(
@@ -35,6 +34,29 @@ def setup_logging():
         root_logger.addHandler(file_handler)
 
 
+def use_rich_console():
+    """将控制台日志换成 Rich 渲染（rich 导入较慢，放在首轮 RA 之后）"""
+    from rich.logging import RichHandler
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if type(handler) is logging.StreamHandler:
+            root_logger.removeHandler(handler)
+    root_logger.addHandler(RichHandler(
+        level=logging.INFO,
+        rich_tracebacks=True,
+        markup=True  # 允许在日志中使用 [bold red]text[/] 这种标记
+    ))
+
+
+def get_if_list():
+    try:
+        return [name for _index, name in socket.if_nameindex()]
+    except OSError:
+        from scapy.interfaces import get_if_list as scapy_get_if_list
+        return scapy_get_if_list()
+
+
 def check_startup(interface):
     """
     执行启动检查：权限、网卡有效性以及 root 警告。
@@ -52,20 +74,59 @@ def check_startup(interface):
         logger.error(f"可用网卡列表: {', '.join(available_interfaces)}")
         sys.exit(1)
 
+    # 3. 打开发包套接字（即之后实际使用的套接字），检查权限
+    from rawsock import sender
     try:
-        test_socket = scapy_conf.L3socket()
-        test_socket.close()
+        sender.ensure_open()
     except Exception as e:
-        logger.error(f"Scapy初始化原始套接字时发生错误: {e}")
+        logger.error(f"初始化原始套接字时发生错误: {e}")
         sys.exit(1)
 
-if __name__ == "__main__":
-    setup_logging()
-    check_startup(interface=IFACE)
-    from api import app
+
+def first_pass():
+    """在导入 Web 框架之前加载通告计划并发送首轮 RA，缩短重启期间的中断"""
+    with startup.phase("导入 RA 模块"):
+        from data.database import init_db
+        from ha import ha
+        from plan import plan
+        from utils import daemon
+    with startup.phase("初始化数据库"):
+        init_db()
+    with startup.phase("加载通告计划"):
+        plan.load()
+    # 主备模式下只有取得租约的实例发送首轮 RA
+    ha.acquire()
+    if RA_SCHEDULE_MODE == "burst":
+        with startup.phase("首轮 RA"):
+            daemon()
+        startup.mark("首轮 RA 已发出")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SUR")
+    parser.add_argument("--startup-profile", action="store_true", help="输出各启动阶段的导入与初始化耗时")
+    parser.add_argument("--port", type=int, default=8000, help="WebUI/API 监听端口（同一主机运行主备两个实例时需不同）")
+    args = parser.parse_args()
+    startup.enabled = args.startup_profile
+
+    with startup.phase("日志"):
+        setup_logging()
+    with startup.phase("启动检查"):
+        check_startup(interface=IFACE)
+    first_pass()
+    with startup.phase("Rich 日志"):
+        use_rich_console()
+    with startup.phase("导入 API"):
+        import uvicorn
+        from api import app
+    # 其余阶段在 api.lifespan 中记录，启动完成后输出报告
     uvicorn.run(
         app,
         host="0.0.0.0",
-        port=8000,
+        port=args.port,
         reload=False
-    )
\ No newline at end of file
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+SUR 基准测试：在临时数据库中生成 N 个设备/网关/标签，测量 RA 流水线各阶段与 REST API 的耗时，
+结果以 JSON 输出，便于在不同提交之间对比。
+
+    python bench.py --sizes 1000,10000,50000 --output bench.json
+    python bench.py --sink pcap:/tmp/ra.pcap        # 帧写入 pcap 文件
+    python bench.py --sink iface:dummy0             # 发送到 dummy/veth 网卡
+
+无需真实网卡，默认发送到空 sink。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def pct(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    return {
+        "count": len(samples),
+        "mean": statistics.fmean(samples),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": samples[-1],
+    }
+
+
+def _mac(prefix: int, i: int) -> str:
+    return f"{prefix:02x}:{i >> 24 & 0xff:02x}:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:01"
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def seed(engine, devices: int, tags: int, gateways_per_tag: int):
+    from sqlmodel import SQLModel
+    from data.database import init_db
+    from models import Device, Gateway, Tag
+
+    SQLModel.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(Tag.__table__.insert(), [
+            {"tag_id": t + 1, "alias": f"tag{t}", "dns": [f"2001:db8::{t + 1:x}"]} for t in range(tags)
+        ])
+        conn.execute(Gateway.__table__.insert(), [
+            {"mac": _mac(0x0a, t * gateways_per_tag + g), "tag_id": t + 1, "weight": 1,
+             "local_ipv6": f"fe80::{t:x}:{g + 1:x}"}
+            for t in range(tags) for g in range(gateways_per_tag)
+        ])
+        conn.execute(Device.__table__.insert(), [
+            {"mac": _mac(0x02, i), "tag_id": i % tags + 1, "alias": f"dev{i}"} for i in range(devices)
+        ])
+
+
+def bench_pipeline(devices: int, passes: int) -> dict:
+    from sqlmodel import Session, select
+    from data.database import engine
+    from models import Device, Gateway, Tag
+    from plan import plan
+    from ra_cache import frame_cache
+    from rawsock import sender
+    from utils import daemon
+
+    # DB 阶段：全量查询三张表
+    def query():
+        with Session(engine) as session:
+            return (session.exec(select(Device)).all(),
+                    session.exec(select(Gateway)).all(),
+                    session.exec(select(Tag)).all())
+    db_times = [_timed(query)[0] for _ in range(passes)]
+
+    load_time, _ = _timed(plan.load)
+
+    # 构造阶段：冷缓存重建全部帧 / 稳态重算（命中缓存）
+    frame_cache.invalidate()
+    build_cold, _ = _timed(plan.rebuild)
+    build_warm = [_timed(plan.rebuild)[0] for _ in range(passes)]
+
+    # 发送阶段：仅发送本轮帧
+    frames = plan.frames()
+    send_times = [_timed(sender.send_batch, frames)[0] for _ in range(passes)]
+
+    # 完整一轮 daemon()
+    pass_times = [_timed(daemon)[0] for _ in range(passes)]
+
+    return {
+        "devices": devices,
+        "advertised": len(frames),
+        "plan_load": load_time,
+        "db_query": _percentiles(db_times),
+        "build_cold": build_cold,
+        "build_cold_per_frame_us": build_cold / max(1, len(frames)) * 1e6,
+        "build_warm": _percentiles(build_warm),
+        "send": _percentiles(send_times),
+        "send_pps": len(frames) / statistics.fmean(send_times) if frames else 0,
+        "daemon_pass": _percentiles(pass_times),
+    }
+
+
+def bench_api(requests: int, token: str) -> dict:
+    from fastapi.testclient import TestClient
+    from api import app
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def run(method, url, **kwargs):
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.request(method, url, headers=headers, **kwargs)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+        return _percentiles(samples)
+
+    results = {
+        "GET /api/devices/": run("GET", "/api/devices/"),
+        "GET /api/neighbors/": run("GET", "/api/neighbors/"),
+    }
+
+    # CRUD：创建、修改、删除同一设备
+    crud = {"POST": [], "PUT": [], "DELETE": []}
+    for i in range(requests):
+        mac = _mac(0xbe, i)
+        for method, url, body in (
+            ("POST", "/api/devices/", {"mac": mac, "tag_id": 1}),
+            ("PUT", f"/api/devices/{mac}", {"mac": mac, "tag_id": 2, "alias": "bench"}),
+            ("DELETE", f"/api/devices/{mac}", None),
+        ):
+            start = time.perf_counter()
+            response = client.request(method, url, headers=headers, json=body)
+            crud[method].append(time.perf_counter() - start)
+            response.raise_for_status()
+    results.update({f"{m} /api/devices/": _percentiles(v) for m, v in crud.items()})
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SUR 基准测试")
+    parser.add_argument("--sizes", default="1000,10000", help="设备数量，逗号分隔（如 1000,10000,50000）")
+    parser.add_argument("--tags", type=int, default=10)
+    parser.add_argument("--gateways-per-tag", type=int, default=3)
+    parser.add_argument("--passes", type=int, default=5, help="每个阶段重复次数")
+    parser.add_argument("--api-requests", type=int, default=100, help="每个 API 的请求次数，0 为跳过")
+    parser.add_argument("--sink", default="null", help="null | pcap:<文件> | iface:<网卡>")
+    parser.add_argument("--db", default=None, help="数据库文件，默认使用临时文件")
+    parser.add_argument("--output", default=None, help="JSON 输出文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    # 必须在导入 config 之前设置
+    workdir = tempfile.mkdtemp(prefix="sur-bench-")
+    os.environ["SUR_DATABASE_PATH"] = args.db or str(Path(workdir) / "bench.db")
+    os.environ.setdefault("API_TOKEN", "bench")
+
+    import rawsock
+    if args.sink.startswith("iface:"):
+        rawsock.sender = rawsock.RawSender(args.sink.split(":", 1)[1])
+    elif args.sink.startswith("pcap:"):
+        rawsock.sender = rawsock.PcapSender(args.sink.split(":", 1)[1])
+    else:
+        rawsock.sender = rawsock.PcapSender()
+    if not args.sink.startswith("iface:"):
+        # 标签指定的其他网卡同样写入该 sink
+        rawsock.senders.factory = lambda iface: rawsock.sender
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+
+    from data.database import engine
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "sink": args.sink,
+        "results": [],
+    }
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        seed_time, _ = _timed(seed, engine, size, args.tags, args.gateways_per_tag)
+        result = {"seed": seed_time, "pipeline": bench_pipeline(size, args.passes)}
+        if args.api_requests:
+            result["api"] = bench_api(args.api_requests, os.environ["API_TOKEN"])
+        report["results"].append(result)
+        print(f"{size} 个设备完成", file=sys.stderr)
+
+    rawsock.senders.close()
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
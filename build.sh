@@ -2,6 +2,7 @@
 python3 -m nuitka \
     --standalone \
     --onefile \
+    --onefile-tempdir-spec="{CACHE_DIR}/SUR/{VERSION}" \
     --include-data-dir=webui=webui \
     --include-data-file=.env=.env \
     --output-dir=out \
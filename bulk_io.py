@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable, Iterator, List, Tuple
+
+from pydantic import ValidationError
+
+# 解析得到的一行：(行号, 数据或错误信息)
+ParsedRow = Tuple[int, object]
+
+
+class RowError(str):
+    """解析失败的行，内容为错误描述"""
+
+
+async def _iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+async def iter_rows(stream: AsyncIterator[bytes], content_type: str) -> AsyncIterator[ParsedRow]:
+    """
+    逐行解析请求体，支持 JSON 数组、NDJSON 与带表头的 CSV。
+    NDJSON/CSV 为流式解析，不会把整个请求体读入内存。
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+
+    if content_type in ("application/json", ""):
+        body = b"".join([chunk async for chunk in stream])
+        try:
+            data = json.loads(body or b"[]")
+        except json.JSONDecodeError as e:
+            yield 0, RowError(f"invalid JSON: {e}")
+            return
+        if not isinstance(data, list):
+            yield 0, RowError("expected a JSON array")
+            return
+        for i, row in enumerate(data, start=1):
+            yield i, row if isinstance(row, dict) else RowError("expected an object")
+        return
+
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        i = 0
+        async for line in _iter_lines(stream):
+            if not line.strip():
+                continue
+            i += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield i, RowError(f"invalid JSON: {e}")
+                continue
+            yield i, row if isinstance(row, dict) else RowError("expected an object")
+        return
+
+    if content_type == "text/csv":
+        header = None
+        i = 0
+        async for line in _iter_lines(stream):
+            if not line.strip():
+                continue
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [h.strip() for h in values]
+                continue
+            i += 1
+            if len(values) != len(header):
+                yield i, RowError(f"expected {len(header)} columns, got {len(values)}")
+                continue
+            # 空字段视为未提供，使用模型默认值
+            yield i, {k: v for k, v in zip(header, values) if v != ""}
+        return
+
+    yield 0, RowError(f"unsupported content type: {content_type}")
+
+
+def format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+def to_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def to_csv(rows: Iterable[dict], fields: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({k: json.dumps(v) if isinstance(v, (list, dict)) else v for k, v in row.items()})
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
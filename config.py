@@ -1,15 +1,64 @@
+import os
+import socket
 from pathlib import Path
 
+# 默认网卡与前缀；标签可单独指定 iface/prefix，以便一个进程服务多个 VLAN
 IFACE='en0'
 PREFIX = "2001:db8::"  # 你的 NPTV6 前缀
 RA_lifetime=300
 RA_interval=120
+# RA 调度模式：burst 为每个周期集中发送一轮；staggered 为按设备错峰发送
+RA_SCHEDULE_MODE = "burst"
+RA_TICK = 1  # staggered 模式下调度器的检查间隔（秒）
+RA_JITTER = 0.05  # staggered 模式下每次调度的随机抖动（占 RA_interval 的比例）
+RA_MAX_PPS = 500  # staggered 模式下全局每秒最多发送的 RA 数，0 为不限制
+RETARGET_DELAY = 0.2  # 增删改后立即发送撤回/新 RA 前的合并窗口（秒），同一窗口内的批量变更只发送一次
+# 在线检测：根据邻居表（REACHABLE）与 RS 判断设备是否在线，超过 PRESENCE_TIMEOUT 秒未出现的设备
+# 按指数退避降低 RA 频率（最长 PRESENCE_MAX_INTERVAL 秒一次），重新出现时立即发送 RA
+PRESENCE = False
+PRESENCE_TIMEOUT = 900
+PRESENCE_MAX_INTERVAL = 3600
+RS_LISTENER = True  # 监听 Router Solicitation 并立即回复单播 RA
+RS_MIN_INTERVAL = 3  # 同一设备两次 RS 应答之间的最小间隔（秒）
+# 网关健康检查：周期性向网关发送 NS，连续失败 GW_PROBE_FALL 次判定为不可用，
+# 连续成功 GW_PROBE_RISE 次恢复；不可用的网关不再被分配给设备
+GW_PROBE = False
+GW_PROBE_INTERVAL = 0.3
+GW_PROBE_FALL = 3
+GW_PROBE_RISE = 2
+NEIGH_RESYNC_INTERVAL = 300  # 邻居表缓存全量校准间隔（秒）
+ARP_CACHE_TTL = 300  # IPv4 -> MAC 解析结果缓存时间（秒）
+ARP_NEGATIVE_TTL = 10  # 解析失败结果的缓存时间（秒）
+ARP_MAX_SWEEP = 1024  # 单次批量解析的最大地址数
+# 前缀自动跟踪：监听该网卡上的全局 IPv6 地址（netlink），其 /64 变化时立即以新前缀重新通告，
+# 旧前缀以 preferred lifetime 0 继续通告 PREFIX_DEPRECATE_TIME 秒；为 None 时使用固定的 PREFIX
+PREFIX_SOURCE = None
+PREFIX_DEPRECATE_TIME = 2 * RA_lifetime
+LOG_SAMPLE_RATE = 100  # 逐包日志的采样率：每 N 个包记录一次（DEBUG 级别）
+# 实时事件流（/api/events/）：每个客户端最多缓存的事件数（消费过慢时丢弃最旧的）、最大客户端数、保活间隔（秒）
+EVENT_QUEUE_SIZE = 1000
+EVENT_MAX_CLIENTS = 500
+EVENT_KEEPALIVE = 15
+# RA 发送历史：每个设备保留最近 HISTORY_PER_DEVICE 条记录，最多 HISTORY_MAX_DEVICES 个设备（约 13 字节/条，预先分配）
+HISTORY = True
+HISTORY_PER_DEVICE = 16
+HISTORY_MAX_DEVICES = 16384
+# 主备高可用：多个实例共用同一个数据库（SUR_DATABASE_PATH），通过数据库中的租约选出主机，只有主机发送 RA。
+# 主机每 HA_RENEW_INTERVAL 秒续约，租约 HA_LEASE_TTL 秒未续约时由备机接管（可用环境变量 SUR_HA=1 开启）
+HA = os.getenv("SUR_HA", "0") == "1"
+HA_NODE_ID = os.getenv("SUR_NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+HA_LEASE_TTL = 3
+HA_RENEW_INTERVAL = 1
 
 BASE_DIR = Path(__file__).resolve().parent
 
-DATABASE_PATH = BASE_DIR / "app.db"
+DATABASE_PATH = Path(os.getenv("SUR_DATABASE_PATH", BASE_DIR / "app.db"))
 DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
-print(BASE_DIR)
+DB_POOL_SIZE = 8  # 常驻连接数（API 线程池 + 调度线程）
+DB_MAX_OVERFLOW = 32  # 突发时额外允许的连接数
+DB_BUSY_TIMEOUT = 5000  # 数据库被锁定时的等待时间（毫秒）
+BULK_CHUNK_SIZE = 1000  # 批量导入/导出每批处理的行数
+LIST_MAX_LIMIT = 1000  # 列表接口单页最大条数
 ENV_FILE = BASE_DIR / ".env"
 WEBUI_DIR = BASE_DIR / "webui"
 WEBUI_ROOT_DIR = WEBUI_DIR / "dist"
@@ -1,26 +1,97 @@
-import hashlib
+import time
+from typing import Dict, Optional
 
 import logging
+from sqlalchemy import event
 from sqlmodel import SQLModel, create_engine, Session
 
-from config import DATABASE_URL, DATABASE_PATH
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_BUSY_TIMEOUT
+from metrics import db_query_seconds
 
 logger = logging.getLogger(__name__)
 
 # 创建引擎（check_same_thread=False 允许多线程访问）
+# API 线程池与调度线程共用同一个数据库文件，连接池按并发线程数配置
 engine = create_engine(
     DATABASE_URL,
     echo=False,  # 生产环境设为 False
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT / 1000},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
 )
 
-db_hash=None
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL：读写互不阻塞；NORMAL 在 WAL 下仍保证一致性，且每次提交无需 fsync
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-8000")  # 8 MB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT}")
+    cursor.close()
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_query_seconds.observe(time.perf_counter() - conn.info["query_start"].pop())
+
+# 需要记录修订号的表：任何增删改都会使对应修订号 +1
+REVISION_TABLES = ("tags", "devices", "gateways")
+
+db_revision=None
 # 创建所有表
 def init_db():
-    global db_hash
+    global db_revision
+    import models  # noqa: F401  确保所有表模型已注册
     SQLModel.metadata.create_all(engine)
-    db_hash=get_db_hash()
-    logger.info(f"Database initialized, current database hash is: {db_hash}")
+    migrate_db()
+    create_revision_triggers()
+    create_lease_table()
+    db_revision=get_db_revision()
+    logger.info(f"Database initialized, current database revision is: {db_revision}")
+
+def migrate_db():
+    """为已有数据库补齐新增的列和索引（create_all 不会修改已存在的表）"""
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+            for column in table.columns:
+                if not existing or column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.exec_driver_sql(ddl)
+                logger.info(f"Database migrated: added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+def create_revision_triggers():
+    """修订号表及触发器，用于低成本的变更检测（替代对整个数据库文件做哈希）"""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS revisions (name TEXT PRIMARY KEY, rev INTEGER NOT NULL DEFAULT 0)"
+        )
+        for table in REVISION_TABLES:
+            conn.exec_driver_sql(f"INSERT OR IGNORE INTO revisions (name, rev) VALUES ('{table}', 0)")
+            for op in ("INSERT", "UPDATE", "DELETE"):
+                conn.exec_driver_sql(
+                    f'CREATE TRIGGER IF NOT EXISTS "{table}_{op.lower()}_rev" AFTER {op} ON "{table}" '
+                    f"BEGIN UPDATE revisions SET rev = rev + 1 WHERE name = '{table}'; END"
+                )
+
+def create_lease_table():
+    """主备高可用的租约表：单行记录当前主机、纪元号（fencing token）及过期时间"""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS leader_lease (name TEXT PRIMARY KEY, holder TEXT NOT NULL, "
+            "epoch INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.exec_driver_sql("INSERT OR IGNORE INTO leader_lease VALUES ('leader', '', 0, 0)")
 
 # 获取数据库会话的依赖
 def get_session():
@@ -28,14 +99,27 @@ def get_session():
         yield session
 
 
-def get_db_hash()->str:
-    with open(DATABASE_PATH, "rb") as f:
-        digest = hashlib.file_digest(f, "sha256")
-        return digest.hexdigest()
+def get_revisions() -> Dict[str, int]:
+    """各表的修订号"""
+    with engine.connect() as conn:
+        return dict(conn.exec_driver_sql("SELECT name, rev FROM revisions").all())
+
+def get_revision(table: str, session: Optional[Session] = None) -> int:
+    """单张表的修订号（一次主键查询）"""
+    if session is None:
+        with Session(engine) as session:
+            return get_revision(table, session)
+    rev = session.connection().exec_driver_sql(
+        "SELECT rev FROM revisions WHERE name = ?", (table,)
+    ).scalar()
+    return rev or 0
+
+def get_db_revision() -> int:
+    return sum(get_revisions().values())
 
 def check_db():
-    curr_db_hash=get_db_hash()
-    if db_hash!=curr_db_hash:
-        logger.info(f"Database modified. Database hash: {curr_db_hash}")
+    curr_db_revision=get_db_revision()
+    if db_revision!=curr_db_revision:
+        logger.info(f"Database modified. Database revision: {curr_db_revision}")
     else:
-        logger.warning(f"Database not modified, please make sure that's correct. Database hash : {curr_db_hash}")
\ No newline at end of file
+        logger.warning(f"Database not modified, please make sure that's correct. Database revision : {curr_db_revision}")
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Set
+
+from config import EVENT_QUEUE_SIZE, EVENT_MAX_CLIENTS
+from metrics import event_clients, events_dropped_total
+
+
+class Subscriber:
+    """一个事件流客户端：有界队列，满时丢弃最旧的事件并计数，不会阻塞发布方"""
+
+    def __init__(self, types: Optional[Set[str]] = None, maxsize: int = EVENT_QUEUE_SIZE):
+        self.types = types
+        self._queue: Deque[bytes] = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, event_type: str, payload: bytes):
+        if self.types is not None and event_type not in self.types:
+            return
+        if len(self._queue) == self._queue.maxlen:
+            self.drop()
+        self._queue.append(payload)
+        self._ready.set()
+
+    def drop(self, n: int = 1):
+        self.dropped += n
+        events_dropped_total.inc(n)
+
+    async def get(self, timeout: float) -> List[bytes]:
+        """取出当前排队的全部事件；超时仍无事件时返回空列表"""
+        if not self._queue:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        batch = list(self._queue)
+        self._queue.clear()
+        if self.dropped:
+            # 通知客户端有事件丢失，应通过 REST 接口重新同步
+            batch.insert(0, format_event(0, "lagged", time.time(), {"dropped": self.dropped}))
+            self.dropped = 0
+        return batch
+
+
+def format_event(seq: int, event_type: str, ts: float, data: dict) -> bytes:
+    """序列化为一条 SSE 消息"""
+    body = json.dumps({"type": event_type, "ts": ts, **data}, separators=(",", ":"))
+    return f"id: {seq}\nevent: {event_type}\ndata: {body}\n\n".encode()
+
+
+class EventBus:
+    """
+    实时事件总线：各工作线程（邻居表、发包、网关检查）调用 publish，事件进入共享缓冲，
+    由事件循环每批只唤醒一次、每个事件只序列化一次，再分发到各客户端的有界队列。
+    没有客户端时 publish 直接返回，不影响发包热路径。
+    """
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE, max_clients: int = EVENT_MAX_CLIENTS):
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self._subscribers: Set[Subscriber] = set()
+        # 待分发的事件；事件循环长时间未能处理时只保留最近的 queue_size 条
+        self._pending: Deque[tuple] = deque(maxlen=queue_size)
+        self._scheduled = False
+        # 缓冲已满而丢弃的事件数，分发时计入每个客户端
+        self._overflow = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.seq = 0
+        self.published = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, event_type: str, **data):
+        if not self._subscribers:
+            return
+        with self._lock:
+            self.seq += 1
+            self.published += 1
+            if len(self._pending) == self._pending.maxlen:
+                self._overflow += 1
+            self._pending.append((self.seq, event_type, time.time(), data))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch)
+        except (AttributeError, RuntimeError):
+            # 事件循环已关闭
+            with self._lock:
+                self._scheduled = False
+                self._overflow = 0
+                self._pending.clear()
+
+    def _dispatch(self):
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            self._scheduled = False
+            overflow, self._overflow = self._overflow, 0
+        subscribers = list(self._subscribers)
+        if overflow:
+            for subscriber in subscribers:
+                subscriber.drop(overflow)
+        for seq, event_type, ts, data in pending:
+            payload = format_event(seq, event_type, ts, data)
+            for subscriber in subscribers:
+                subscriber.put(event_type, payload)
+
+    def subscribe(self, types: Optional[Set[str]] = None) -> Optional[Subscriber]:
+        """在事件循环中调用；客户端数已达上限时返回 None"""
+        if len(self._subscribers) >= self.max_clients:
+            return None
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(types, self.queue_size)
+        self._subscribers.add(subscriber)
+        event_clients.set(len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        event_clients.set(len(self._subscribers))
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._subscribers),
+            "published": self.published,
+            "queued": sum(len(s) for s in list(self._subscribers)),
+        }
+
+
+event_bus = EventBus()
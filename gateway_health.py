@@ -0,0 +1,197 @@
+import logging
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+from scapy.arch import in6_getifaddr
+from scapy.layers.inet6 import IPv6, ICMPv6ND_NS, ICMPv6NDOptSrcLLAddr
+from scapy.layers.l2 import Ether
+
+from config import IFACE, GW_PROBE_INTERVAL, GW_PROBE_FALL, GW_PROBE_RISE
+from events import event_bus
+from plan import plan, normalize_mac
+from ra_cache import get_iface_mac
+from rawsock import senders, open_listener, format_mac
+from utils import retarget
+
+logger = logging.getLogger(__name__)
+
+ICMPV6_NA = 136
+
+
+@dataclass
+class GatewayState:
+    up: bool = True
+    ok_streak: int = 0
+    fail_streak: int = 0
+    last_seen: float = 0.0
+    changed_at: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "up": self.up,
+            "ok_streak": self.ok_streak,
+            "fail_streak": self.fail_streak,
+            "last_seen": self.last_seen,
+            "changed_at": self.changed_at,
+        }
+
+
+def get_iface_lla(iface: str = IFACE) -> Optional[str]:
+    for addr, _scope, ifname in in6_getifaddr():
+        if ifname == iface and addr.startswith("fe80"):
+            return addr
+    return None
+
+
+def build_probe(gw_mac: str, gw_lla: str, src_lla: str, iface: str = IFACE) -> bytes:
+    """构造单播 NS（NUD 探测）"""
+    src_mac = get_iface_mac(iface)
+    return bytes(
+        Ether(src=src_mac, dst=gw_mac)
+        / IPv6(src=src_lla, dst=gw_lla)
+        / ICMPv6ND_NS(tgt=gw_lla)
+        / ICMPv6NDOptSrcLLAddr(lladdr=src_mac)
+    )
+
+
+class GatewayProber:
+    """
+    网关健康检查：每 GW_PROBE_INTERVAL 秒向每个网关发送一次单播 NS，并等待 NA。
+    状态带滞回：连续 GW_PROBE_FALL 次无应答判定为 down，连续 GW_PROBE_RISE 次应答恢复 up。
+    状态变化时立即重新分配受影响的设备，并以 lifetime 0 撤回旧网关。
+    每个网卡一个探测线程，只探测该网卡上的网关。
+    """
+
+    def __init__(self, interval: float = GW_PROBE_INTERVAL,
+                 fall: int = GW_PROBE_FALL, rise: int = GW_PROBE_RISE):
+        self.interval = interval
+        self.fall = fall
+        self.rise = rise
+        self.states: Dict[str, GatewayState] = {}
+        self._probes: Dict[tuple, bytes] = {}
+        self._stops: Dict[str, threading.Event] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        # sync 可能同时由多个 CRUD 请求线程调用
+        self._threads_lock = threading.Lock()
+        # 只有 start 之后 sync 才会启动线程（配置关闭或平台不支持时保持停止）
+        self._started = False
+
+    def start(self, ifaces: Optional[Iterable[str]] = None):
+        if not hasattr(socket, "AF_PACKET"):
+            logger.warning("当前平台不支持 AF_PACKET，网关健康检查未启动")
+            return
+        self._started = True
+        self.sync(ifaces or [IFACE])
+
+    def sync(self, ifaces: Iterable[str]):
+        """按网卡列表启动新的探测线程，停止已不再使用的网卡上的线程"""
+        if not self._started or not hasattr(socket, "AF_PACKET"):
+            return
+        ifaces = set(ifaces)
+        with self._threads_lock:
+            for iface in [i for i in self._threads if i not in ifaces]:
+                self._stop_iface(iface)
+            # 启动失败（如网卡尚未创建）而退出的线程会在下次同步时重试
+            running = {i for i, t in self._threads.items() if t.is_alive()}
+            for iface in ifaces - running:
+                stop = self._stops[iface] = threading.Event()
+                thread = self._threads[iface] = threading.Thread(
+                    target=self._run, args=(iface, stop), name=f"gateway-prober-{iface}", daemon=True)
+                thread.start()
+
+    def _stop_iface(self, iface: str):
+        self._stops.pop(iface).set()
+        self._threads.pop(iface).join(timeout=2)
+
+    def stop(self):
+        self._started = False
+        with self._threads_lock:
+            for iface in list(self._threads):
+                self._stop_iface(iface)
+
+    def _run(self, iface: str, stop: threading.Event):
+        src_lla = get_iface_lla(iface)
+        if src_lla is None:
+            logger.error(f"网卡 {iface} 没有链路本地地址，网关健康检查未启动")
+            return
+        try:
+            sock = open_listener(iface, ICMPV6_NA, timeout=self.interval)
+        except OSError as e:
+            logger.error(f"网卡 {iface} 上的网关健康检查启动失败: {e}")
+            return
+        logger.info(f"已在网卡 {iface} 上启动网关健康检查")
+        with sock:
+            while not stop.is_set():
+                self._round(sock, src_lla, iface)
+
+    def _round(self, sock, src_lla: str, iface: str = IFACE):
+        gateways = plan.gateway_list(iface)
+        known = {normalize_mac(gw.mac) for gw in gateways}
+        for mac in known:
+            self.states.setdefault(mac, GatewayState())
+        all_known = {normalize_mac(gw.mac) for gw in plan.gateway_list()}
+        for mac in [m for m in self.states if m not in all_known]:
+            self.states.pop(mac, None)
+
+        round_start = time.monotonic()
+        frames = []
+        for gw in gateways:
+            key = (gw.mac, gw.local_ipv6, iface)
+            frame = self._probes.get(key)
+            if frame is None:
+                frame = self._probes[key] = build_probe(gw.mac, gw.local_ipv6, src_lla, iface)
+            frames.append(frame)
+        senders.get(iface).send_batch(frames)
+
+        # 在本轮剩余时间内收集 NA
+        deadline = round_start + self.interval
+        while (remaining := deadline - time.monotonic()) > 0:
+            sock.settimeout(remaining)
+            try:
+                frame = sock.recv(2048)
+            except socket.timeout:
+                break
+            except OSError as e:
+                logger.error(f"网关健康检查接收失败: {e}")
+                break
+            state = self.states.get(format_mac(frame[6:12]))
+            if state is not None:
+                state.last_seen = time.monotonic()
+
+        for gw in gateways:
+            state = self.states.get(normalize_mac(gw.mac))
+            if state is not None:
+                self._update(gw.mac, state, state.last_seen >= round_start)
+
+    def _update(self, gw_mac: str, state: GatewayState, ok: bool):
+        if ok:
+            state.ok_streak += 1
+            state.fail_streak = 0
+            if not state.up and state.ok_streak >= self.rise:
+                self._transition(gw_mac, state, True)
+        else:
+            state.fail_streak += 1
+            state.ok_streak = 0
+            if state.up and state.fail_streak >= self.fall:
+                self._transition(gw_mac, state, False)
+
+    def _transition(self, gw_mac: str, state: GatewayState, up: bool):
+        state.up = up
+        state.changed_at = time.time()
+        if up:
+            logger.info(f"网关 {gw_mac} 已恢复")
+        else:
+            logger.warning(f"网关 {gw_mac} 无响应，已从可选网关中移除")
+        changes = plan.set_gateway_health(gw_mac, up)
+        event_bus.publish("gateway", mac=gw_mac, up=up, reassigned=len(changes))
+        if changes:
+            retarget(changes)
+
+    def to_dict(self) -> dict:
+        return {mac: state.to_dict() for mac, state in list(self.states.items())}
+
+
+gateway_prober = GatewayProber()
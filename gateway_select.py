@@ -0,0 +1,75 @@
+import hashlib
+import math
+from typing import List, Optional, Sequence
+
+
+def _normalize(mac: str) -> str:
+    return mac.replace('-', ':').lower()
+
+
+def _uniform(device_mac: str, gateway_mac: str) -> float:
+    """(设备, 网关) 对应的 (0, 1) 内稳定伪随机数"""
+    key = f"{_normalize(device_mac)}|{_normalize(gateway_mac)}".encode()
+    h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+    return (h + 1) / (2 ** 64 + 1)
+
+
+def _weight(gateway) -> float:
+    weight = getattr(gateway, "weight", None)
+    return 1.0 if weight is None else float(weight)
+
+
+def select_gateway(device_mac: str, gateways: Sequence) -> Optional[object]:
+    """
+    加权 rendezvous（HRW）哈希选择网关：
+    每个 (设备, 网关) 计算 -w / ln(u)，取最大者。网关增删时只有约 1/N 的设备会迁移，
+    且各网关分到的设备数与权重成正比。
+    """
+    best = None
+    best_score = -1.0
+    for gw in gateways:
+        weight = _weight(gw)
+        if weight <= 0:
+            continue
+        score = -weight / math.log(_uniform(device_mac, gw.mac))
+        if score > best_score:
+            best, best_score = gw, score
+    return best
+
+
+def _remap_ratio(devices: List[str], before: Sequence, after: Sequence, selector) -> float:
+    moved = sum(1 for mac in devices if selector(mac, before).mac != selector(mac, after).mac)
+    return moved / len(devices)
+
+
+if __name__ == "__main__":
+    # 统计网关增删时迁移的设备比例，并与原先的取模算法对比
+    from dataclasses import dataclass
+
+    @dataclass
+    class _GW:
+        mac: str
+        weight: int = 1
+
+    def _modulo(mac, gateways):
+        return gateways[int(_normalize(mac).replace(':', ''), 16) % len(gateways)]
+
+    devices = [f"02:00:00:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}" for i in range(20000)]
+    gateways = [_GW(f"0a:00:00:00:00:{i:02x}") for i in range(5)]
+
+    cases = {
+        "add one (5 -> 6)": (gateways, gateways + [_GW("0a:00:00:00:00:ff")]),
+        "remove one (5 -> 4)": (gateways, gateways[:2] + gateways[3:]),
+        "reweight one (1 -> 2)": (gateways, gateways[:-1] + [_GW(gateways[-1].mac, 2)]),
+    }
+    for name, (before, after) in cases.items():
+        hrw = _remap_ratio(devices, before, after, select_gateway)
+        mod = _remap_ratio(devices, before, after, _modulo)
+        print(f"{name:24} rendezvous: {hrw:6.1%}   modulo: {mod:6.1%}")
+
+    counts = {}
+    weighted = gateways[:-1] + [_GW(gateways[-1].mac, 3)]
+    for mac in devices:
+        gw = select_gateway(mac, weighted).mac
+        counts[gw] = counts.get(gw, 0) + 1
+    print("weighted share:", {k[-2:]: f"{v / len(devices):.1%}" for k, v in sorted(counts.items())})
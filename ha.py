@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from config import HA, HA_NODE_ID, HA_LEASE_TTL, HA_RENEW_INTERVAL
+from data.database import engine
+from metrics import ha_leader, ha_transitions_total
+from rawsock import senders
+
+logger = logging.getLogger(__name__)
+
+
+class NotLeaderError(Exception):
+    """备机（或已失去租约的主机）上的数据库写入"""
+
+    def __init__(self, holder: str):
+        super().__init__(f"not the leader, current leader is {holder or 'unknown'}")
+        self.holder = holder
+
+
+class LeaderLease:
+    """
+    主备高可用：多个实例共用同一数据库，leader_lease 表中的一行租约决定谁是主机，只有主机发送 RA。
+    主机每 renew_interval 秒续约；租约过期后由备机接管，纪元号（epoch）+1 作为 fencing token：
+    - 发送：主机在本地截止时间（续约开始 + ttl - renew_interval）前未能续约即停止发送，
+      早于租约在数据库中过期、备机可以接管的时间，两台实例不会同时发送；
+    - 写入：每次提交前在同一事务中校验租约仍属于本实例的当前纪元，否则拒绝提交。
+    成为主机时重新加载通告计划并立即发送一轮（on_promote），正常退出时释放租约以便备机立即接管。
+    """
+
+    def __init__(self, enabled: bool = HA, node_id: str = HA_NODE_ID, ttl: float = HA_LEASE_TTL,
+                 renew_interval: float = HA_RENEW_INTERVAL):
+        self.enabled = enabled
+        self.node_id = node_id
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.leader = False
+        self.epoch = 0
+        self.holder = ""
+        self.on_promote: Optional[Callable[[], None]] = None
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._fenced = False
+        self.transitions = 0
+        self.last_error: Optional[str] = None
+
+    def active(self) -> bool:
+        """本实例当前是否可以发送 RA"""
+        if not self.enabled:
+            return True
+        return self.leader and time.monotonic() < self._valid_until
+
+    def acquire(self) -> bool:
+        """启动时（首轮 RA 之前）调用：安装发送闸门与写入校验，尝试获取一次租约，返回是否为主机"""
+        if not self.enabled:
+            return True
+        senders.gate = self.active
+        if not self._fenced:
+            event.listen(Session, "before_commit", self._check_fence)
+            self._fenced = True
+        self.renew(notify=False)
+        return self.leader
+
+    def renew(self, notify: bool = True):
+        """续约（主机）或在租约过期时接管（备机）"""
+        started = time.monotonic()
+        now = time.time()
+        try:
+            with engine.begin() as conn:
+                # 不使用 UPDATE ... RETURNING（需要 SQLite 3.35+）：条件更新后在同一事务中读取纪元号，
+                # 更新已持有写锁，其他实例无法在两条语句之间修改租约
+                updated = conn.exec_driver_sql(
+                    "UPDATE leader_lease SET "
+                    "epoch = CASE WHEN holder = ? AND epoch = ? THEN epoch ELSE epoch + 1 END, "
+                    "holder = ?, expires = ? "
+                    "WHERE name = 'leader' AND ((holder = ? AND epoch = ?) OR expires < ?)",
+                    (self.node_id, self.epoch, self.node_id, now + self.ttl, self.node_id, self.epoch, now),
+                ).rowcount
+                row = None
+                if updated:
+                    row = conn.exec_driver_sql("SELECT epoch FROM leader_lease WHERE name = 'leader'").first()
+                else:
+                    self.holder = conn.exec_driver_sql(
+                        "SELECT holder FROM leader_lease WHERE name = 'leader'").scalar() or ""
+            self.last_error = None
+        except Exception as e:
+            # 数据库暂时不可用：主机在本地截止时间到达后自动停止发送
+            self.last_error = str(e)
+            logger.error(f"租约续约失败: {e}")
+            if self.leader and not self.active():
+                self._demote()
+            return
+
+        if row is None:
+            if self.leader:
+                self._demote()
+            return
+        promoted = not self.leader or row[0] != self.epoch
+        self.epoch = row[0]
+        self.holder = self.node_id
+        self._valid_until = started + self.ttl - self.renew_interval
+        if promoted:
+            self._promote(notify)
+
+    def _promote(self, notify: bool):
+        self.leader = True
+        self.transitions += 1
+        ha_leader.set(1)
+        ha_transitions_total.inc(role="leader")
+        logger.warning(f"已成为主机（{self.node_id}，纪元 {self.epoch}），开始发送 RA")
+        if notify and self.on_promote is not None:
+            try:
+                self.on_promote()
+            except Exception as e:
+                logger.error(f"主机接管回调执行失败: {e}")
+
+    def _demote(self):
+        self.leader = False
+        self.transitions += 1
+        ha_leader.set(0)
+        ha_transitions_total.inc(role="standby")
+        logger.warning(f"已失去主机租约（当前主机 {self.holder or '未知'}），停止发送 RA")
+
+    def _check_fence(self, session):
+        row = session.connection().exec_driver_sql(
+            "SELECT 1 FROM leader_lease WHERE name = 'leader' AND holder = ? AND epoch = ? AND expires > ?",
+            (self.node_id, self.epoch, time.time() + self.renew_interval),
+        ).first()
+        if row is None or not self.active():
+            raise NotLeaderError(self.holder if self.holder != self.node_id else "")
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ha-lease", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.renew_interval):
+            self.renew()
+            if self.leader and not self.active():
+                self._demote()
+
+    def stop(self):
+        """停止续约；若为主机则释放租约，备机在一个续约周期内接管"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if not self.enabled or not self.leader:
+            return
+        self.leader = False
+        ha_leader.set(0)
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(
+                    "UPDATE leader_lease SET expires = 0 WHERE name = 'leader' AND holder = ? AND epoch = ?",
+                    (self.node_id, self.epoch),
+                )
+            logger.info("已释放主机租约")
+        except Exception as e:
+            logger.error(f"释放租约失败: {e}")
+
+    def to_dict(self) -> dict:
+        row = None
+        if self.enabled:
+            with engine.connect() as conn:
+                row = conn.exec_driver_sql(
+                    "SELECT holder, epoch, expires FROM leader_lease WHERE name = 'leader'").first()
+        return {
+            "enabled": self.enabled,
+            "node_id": self.node_id,
+            "role": "leader" if self.active() else "standby",
+            "epoch": self.epoch,
+            "leader": row[0] if row else None,
+            "lease_epoch": row[1] if row else None,
+            "lease_expires_in": row[2] - time.time() if row else None,
+            "transitions": self.transitions,
+            "last_error": self.last_error,
+        }
+
+
+ha = LeaderLease()
@@ -0,0 +1,207 @@
+import ipaddress
+import logging
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import HISTORY, HISTORY_PER_DEVICE, HISTORY_MAX_DEVICES
+from ra_cache import mac_to_bytes
+from rawsock import senders, format_mac
+
+logger = logging.getLogger(__name__)
+
+# 触发原因编码（从 1 开始，0 表示空槽）
+TRIGGERS = ("periodic", "rs", "presence", "retarget", "withdrawal")
+TRIGGER_CODES = {name: i + 1 for i, name in enumerate(TRIGGERS)}
+MAX_PROFILES = 65535
+
+Profile = Tuple[str, str, str, Tuple[str, ...], int]  # (网卡, 网关 MAC, 网关地址, DNS, lifetime)
+
+# RA 帧内偏移：以太网头 14 字节 + IPv6 头 40 字节，RA 头 16 字节之后为选项
+IPV6_SRC = slice(22, 38)
+RA_ROUTER_LIFETIME = slice(60, 62)
+RA_OPTIONS = 70
+ND_OPT_SOURCE_LLADDR = 1
+ND_OPT_RDNSS = 25
+
+
+def parse_ra(frame: bytes) -> Tuple[str, str, Tuple[str, ...], int]:
+    """从实际发送的 RA 帧解析 (网关 MAC, 网关地址, DNS, router lifetime)"""
+    gateway_mac, dns = "", ()
+    i = RA_OPTIONS
+    while i + 2 <= len(frame):
+        opt_type, opt_len = frame[i], frame[i + 1] * 8
+        if not opt_len:
+            break
+        if opt_type == ND_OPT_SOURCE_LLADDR:
+            gateway_mac = format_mac(frame[i + 2:i + 8])
+        elif opt_type == ND_OPT_RDNSS:
+            dns = tuple(str(ipaddress.IPv6Address(frame[j:j + 16])) for j in range(i + 8, i + opt_len, 16))
+        i += opt_len
+    return (gateway_mac, str(ipaddress.IPv6Address(frame[IPV6_SRC])), dns,
+            int.from_bytes(frame[RA_ROUTER_LIFETIME], "big"))
+
+
+class RAHistory:
+    """
+    每个设备最近 per_device 次 RA 发送记录（时间、网关、DNS、lifetime、触发原因、结果）。
+    记录存放在预先分配的定长数组中：设备槽位 × 每设备条数，内存占用与运行时间无关；
+    设备数超过 max_devices 时按 clock 算法（二次机会）复用近期未发送的设备的槽位，摊还 O(1)。
+    网关/DNS/lifetime 组合只保存一次（profile，从实际发送的帧中解析，同一模板只解析一次），
+    每条记录只写入时间、profile 编号和一个标志字节。撤回（lifetime 0）不计为成功通告。
+    """
+
+    def __init__(self, enabled: bool = HISTORY, per_device: int = HISTORY_PER_DEVICE,
+                 max_devices: int = HISTORY_MAX_DEVICES):
+        self.enabled = enabled
+        self.per_device = per_device
+        self.max_devices = max_devices
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        size = self.per_device * self.max_devices if self.enabled else 0
+        slots = self.max_devices if self.enabled else 0
+        self._ts = array("d", bytes(8 * size))
+        self._profile = array("H", bytes(2 * size))
+        # 高位为触发原因编码，最低位为是否发送成功；0 为空
+        self._flags = array("B", bytes(size))
+        self._head = array("H", bytes(2 * slots))
+        # clock 淘汰：记录时置 1，指针扫过时清 0，扫到为 0 的槽位即淘汰
+        self._ref = array("B", bytes(slots))
+        self._hand = 0
+        self._last_ok = array("d", bytes(8 * slots))
+        self._slot_keys: List[Optional[bytes]] = [None] * slots
+        self._slots: Dict[bytes, int] = {}
+        self._profiles: List[Profile] = []
+        self._profile_ids: Dict[Profile, int] = {}
+        # (网卡, 帧去掉目的 MAC 后的字节) -> profile 编号
+        self._template_ids: Dict[Tuple[str, bytes], int] = {}
+        self.records = 0
+
+    def _allocate(self, key: bytes) -> int:
+        if len(self._slots) < self.max_devices:
+            slot = len(self._slots)
+        else:
+            ref, hand = self._ref, self._hand
+            while ref[hand]:
+                ref[hand] = 0
+                hand = hand + 1 if hand + 1 < self.max_devices else 0
+            slot = hand
+            self._hand = hand + 1 if hand + 1 < self.max_devices else 0
+            del self._slots[self._slot_keys[slot]]
+            start = slot * self.per_device
+            self._flags[start:start + self.per_device] = array("B", bytes(self.per_device))
+            self._head[slot] = 0
+            self._last_ok[slot] = 0.0
+        self._slots[key] = slot
+        self._slot_keys[slot] = key
+        return slot
+
+    def _profile_id(self, iface: str, frame: bytes) -> Tuple[int, int]:
+        """返回 (profile 编号, router lifetime)"""
+        template = (iface, frame[6:])
+        pid = self._template_ids.get(template)
+        if pid is None:
+            profile = (iface, *parse_ra(frame))
+            pid = self._profile_ids.get(profile)
+            if pid is None:
+                if len(self._profiles) >= MAX_PROFILES or len(self._template_ids) >= MAX_PROFILES:
+                    logger.info("RA 历史的网关/DNS 组合过多，已清空历史记录")
+                    self.clear()
+                pid = self._profile_ids[profile] = len(self._profiles)
+                self._profiles.append(profile)
+            self._template_ids[template] = pid
+        return pid, self._profiles[pid][4]
+
+    def record_frames(self, iface: str, tag_id, gateway_mac: str, trigger: str, frames: Sequence[bytes],
+                      ok: bool):
+        """记录一组发往同一网关的帧（目的 MAC 取自帧的前 6 字节，其余字段取自帧本身）"""
+        if not self.enabled or not frames:
+            return
+        code = TRIGGER_CODES.get(trigger)
+        if code is None:
+            return
+        now = time.time()
+        flag = code << 1 | ok
+        k = self.per_device
+        with self._lock:
+            pid, lifetime = self._profile_id(iface, frames[0])
+            advertised = ok and lifetime > 0
+            slots, ts, profile, flags = self._slots, self._ts, self._profile, self._flags
+            head, ref, last_ok = self._head, self._ref, self._last_ok
+            n = 0
+            for frame in frames:
+                key = frame[:6]
+                slot = slots.get(key)
+                if slot is None:
+                    slot = self._allocate(key)
+                pos = head[slot]
+                i = slot * k + pos
+                ts[i] = now
+                profile[i] = pid
+                flags[i] = flag
+                head[slot] = pos + 1 if pos + 1 < k else 0
+                ref[slot] = 1
+                if advertised:
+                    last_ok[slot] = now
+                n += 1
+            self.records += n
+
+    def query(self, mac: str) -> List[dict]:
+        """设备的发送记录，最新的在前"""
+        now = time.time()
+        with self._lock:
+            slot = self._slots.get(mac_to_bytes(mac))
+            if slot is None:
+                return []
+            k = self.per_device
+            result = []
+            pos = self._head[slot]
+            for _ in range(k):
+                pos = pos - 1 if pos else k - 1
+                i = slot * k + pos
+                flag = self._flags[i]
+                if not flag:
+                    break
+                iface, gateway_mac, gateway_lla, dns, lifetime = self._profiles[self._profile[i]]
+                result.append({
+                    "ts": self._ts[i],
+                    "ago": now - self._ts[i],
+                    "trigger": TRIGGERS[(flag >> 1) - 1],
+                    "ok": bool(flag & 1),
+                    "iface": iface,
+                    "gateway": gateway_mac,
+                    "gateway_lla": gateway_lla,
+                    "dns": list(dns),
+                    "lifetime": lifetime,
+                })
+        return result
+
+    def last_advertised_ago(self, mac: str) -> Optional[float]:
+        """距上次成功通告（不含撤回）的秒数，无记录时为 None"""
+        try:
+            slot = self._slots.get(mac_to_bytes(mac))
+        except ValueError:
+            return None
+        if slot is None or not self._last_ok[slot]:
+            return None
+        return time.time() - self._last_ok[slot]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "devices": len(self._slots),
+            "max_devices": self.max_devices,
+            "per_device": self.per_device,
+            "profiles": len(self._profiles),
+            "records": self.records,
+            "memory_bytes": sum(a.itemsize * len(a) for a in (
+                self._ts, self._profile, self._flags, self._head, self._ref, self._last_ok)),
+        }
+
+
+history = RAHistory()
+# 接入发包器：所有经 send_grouped 发送的 RA（周期、撤回、重新指定网关）都会被记录
+senders.on_batch = history.record_frames
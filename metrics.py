@@ -0,0 +1,172 @@
+import bisect
+import math
+import threading
+from typing import Dict, Sequence, Tuple
+
+from config import LOG_SAMPLE_RATE
+
+# 默认直方图桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., +Inf 计数, 总和]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[i] += 1
+            data[-1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = self.header()
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), data[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {data[-1]!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class LogSampler:
+    """每 rate 次调用返回一次 True，用于热路径日志采样"""
+
+    def __init__(self, rate: int = LOG_SAMPLE_RATE):
+        self.rate = max(1, rate)
+        self._count = 0
+
+    def __call__(self) -> bool:
+        self._count += 1
+        return self._count % self.rate == 1 or self.rate == 1
+
+
+registry = Registry()
+
+daemon_pass_seconds = registry.register(Histogram(
+    "sur_daemon_pass_seconds", "Duration of a full RA pass"))
+ra_sent_total = registry.register(Counter(
+    "sur_ra_sent_total", "RAs sent", ("tag", "gateway", "trigger")))
+ra_failed_total = registry.register(Counter(
+    "sur_ra_failed_total", "RAs that failed to send", ("tag", "gateway", "trigger")))
+scheduler_lag_seconds = registry.register(Histogram(
+    "sur_scheduler_lag_seconds", "Delay between a job's scheduled and actual start", ("job",)))
+neighbor_dump_seconds = registry.register(Histogram(
+    "sur_neighbor_dump_seconds", "Duration of a full netlink neighbor dump"))
+db_query_seconds = registry.register(Histogram(
+    "sur_db_query_seconds", "Duration of SQLite statements"))
+api_request_seconds = registry.register(Histogram(
+    "sur_api_request_seconds", "API latency per route", ("method", "route", "status")))
+rs_response_seconds = registry.register(Histogram(
+    "sur_rs_response_seconds", "Latency from Router Solicitation to unicast RA"))
+plan_devices = registry.register(Gauge(
+    "sur_plan_devices", "Devices in the advertisement plan"))
+ra_skipped_total = registry.register(Counter(
+    "sur_ra_skipped_total", "Periodic RAs skipped because the device is absent", ("trigger",)))
+pass_devices = registry.register(Gauge(
+    "sur_pass_devices", "Devices sent to or skipped in the last full RA pass", ("result",)))
+presence_devices = registry.register(Gauge(
+    "sur_presence_devices", "Devices by presence state", ("state",)))
+event_clients = registry.register(Gauge(
+    "sur_event_clients", "Connected live event stream clients"))
+ha_leader = registry.register(Gauge(
+    "sur_ha_leader", "1 if this instance holds the HA lease and sends RAs"))
+ha_transitions_total = registry.register(Counter(
+    "sur_ha_transitions_total", "HA role changes", ("role",)))
+events_dropped_total = registry.register(Counter(
+    "sur_events_dropped_total", "Events dropped because a stream client was too slow"))
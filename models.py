@@ -1,8 +1,10 @@
+import ipaddress
 from dataclasses import dataclass
 from typing import Optional, List
 
+from pydantic import field_validator
 from sqlmodel import SQLModel, Field, Column
-from sqlalchemy import JSON
+from sqlalchemy import JSON, text
 
 
 # 标签模型
@@ -12,6 +14,42 @@ class Tag(SQLModel, table=True):
     tag_id: Optional[int] = Field(default=None, primary_key=True)
     alias: str = Field(index=True)
     dns: List[str] = Field(default_factory=list, sa_column=Column(JSON))
+    # 该标签的设备所在网卡及通告的前缀，为空时使用 config.IFACE / config.PREFIX
+    iface: Optional[str] = Field(default=None, index=True)
+    prefix: Optional[str] = None
+    # 该标签的 RA 参数，为空时使用 config 中的全局值
+    ra_interval: Optional[int] = Field(default=None, gt=0)  # 发送间隔（秒）
+    ra_lifetime: Optional[int] = Field(default=None, ge=0, le=65535)  # router/前缀/DNS 生存期（秒）
+    prefix_len: Optional[int] = Field(default=None, gt=0, le=128)  # 前缀长度，默认 64
+    mtu: Optional[int] = Field(default=None, ge=1280, le=65535)  # MTU 选项
+    managed: Optional[bool] = None  # M 标志
+    other: Optional[bool] = None  # O 标志
+    # Route Information，如 "2001:db8:100::/48"；server_default 使升级时已有的标签得到 [] 而不是 NULL
+    routes: List[str] = Field(default_factory=list, sa_column=Column(JSON, server_default=text("'[]'")))
+
+    # 以下字段会直接写入 RA 帧，非法值须在写入数据库前拒绝，否则构造帧时出错
+    @field_validator("dns")
+    @classmethod
+    def _check_dns(cls, value: List[str]) -> List[str]:
+        return [str(ipaddress.IPv6Address(addr)) for addr in value]
+
+    @field_validator("prefix")
+    @classmethod
+    def _check_prefix(cls, value: Optional[str]) -> Optional[str]:
+        return str(ipaddress.IPv6Address(value)) if value else value
+
+    @field_validator("routes", mode="before")
+    @classmethod
+    def _default_routes(cls, value):
+        # 未设置默认值的旧版本迁移后可能留下 NULL
+        return [] if value is None else value
+
+    @field_validator("routes")
+    @classmethod
+    def _check_routes(cls, value: List[str]) -> List[str]:
+        # 未写前缀长度时按 /64 处理（与构造 RA 时的默认值一致）
+        return [str(ipaddress.IPv6Network(route if "/" in route else f"{route}/64", strict=False))
+                for route in value]
 
 
 # 设备模型
@@ -19,7 +57,7 @@ class Device(SQLModel, table=True):
     __tablename__ = "devices"
 
     mac: str = Field(primary_key=True, max_length=17)
-    tag_id: int = Field(foreign_key="tags.tag_id")
+    tag_id: int = Field(foreign_key="tags.tag_id", index=True)
     alias: Optional[str] = None
 
 
@@ -28,9 +66,21 @@ class Gateway(SQLModel, table=True):
     __tablename__ = "gateways"
 
     mac: str = Field(primary_key=True, max_length=17)
-    tag_id: int = Field(foreign_key="tags.tag_id")
+    tag_id: int = Field(foreign_key="tags.tag_id", index=True)
     alias: Optional[str] = None
     local_ipv6: str
+    # 负载均衡权重，0 表示不参与选择
+    weight: Optional[int] = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+# IPv4 批量解析请求
+class IPv4BulkRequest(SQLModel):
+    ips: List[str] = Field(default_factory=list)
+    cidr: Optional[str] = None
+
+# 手动（或由外部脚本）切换前缀
+class PrefixUpdate(SQLModel):
+    prefix: str
+
 
 @dataclass
 class IPv6Neighbor:
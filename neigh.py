@@ -1,24 +1,282 @@
 import platform
-from typing import List
+import select
+import threading
+import time
+from typing import Callable, List, Dict, Optional, Set, Tuple
 import logging
-if platform.system() == "Linux":
-    from pyroute2 import IPRoute
-from scapy.all import srp1
 from scapy.layers.l2 import Ether, ARP
+import ipaddress
 import socket
 
-from config import IFACE
+from events import event_bus
+from metrics import neighbor_dump_seconds
+from config import IFACE, NEIGH_RESYNC_INTERVAL, ARP_CACHE_TTL, ARP_NEGATIVE_TTL, ARP_MAX_SWEEP
 from models import IPv6Neighbor
 logger = logging.getLogger(__name__)
 
-def get_ipv6_neighs() -> List[IPv6Neighbor]:
+# netlink 多播组（linux/rtnetlink.h），直接定义以免启动时导入 pyroute2
+RTMGRP_NEIGH = 0x4
+RTMGRP_IPV6_IFADDR = 0x100
+
+
+def iproute():
+    """打开 netlink 连接；pyroute2 导入较慢，首次使用时才加载"""
+    from pyroute2 import IPRoute
+    return IPRoute()
+
+# 无有效链路层地址的邻居状态
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+# 最近确认可达
+NUD_REACHABLE = 0x02
+
+NeighKey = Tuple[int, int, str]  # (ifindex, family, 地址)
+
+
+class NeighborCache:
+    """
+    常驻 netlink 订阅（RTM_NEWNEIGH/RTM_DELNEIGH）维护的内存邻居表，按 MAC 和地址双向索引。
+    启动时全量同步一次，之后只处理增量事件，并每 NEIGH_RESYNC_INTERVAL 秒全量校准。
+    """
+
+    def __init__(self, iface: str = IFACE, resync_interval: float = NEIGH_RESYNC_INTERVAL):
+        self.iface = iface
+        self.resync_interval = resync_interval
+        self.ifindex: Optional[int] = None
+        # 网卡名 -> ifindex，每次全量同步时刷新；不存在的网卡在下次全量同步前不再查询
+        self._ifindexes: Dict[str, int] = {}
+        self._missing_ifaces: Set[str] = set()
+        self._by_addr: Dict[NeighKey, str] = {}
+        self._by_mac: Dict[str, Set[NeighKey]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # 各网卡的 IPv6 邻居视图，邻居表变化时清空
+        self._ipv6_views: Dict[str, List[IPv6Neighbor]] = {}
+        self.version = 0
+        # 邻居确认可达（REACHABLE）时以其 MAC 回调，用于设备在线检测
+        self.on_reachable: Optional[Callable[[str], None]] = None
+        # 统计
+        self.events = 0
+        self.resyncs = 0
+        self.last_event_at = 0.0
+        self.last_sync_at = 0.0
+        # 最近 60 秒每秒的事件数
+        self._rate_counts = [0] * 60
+        self._rate_seconds = [0] * 60
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self.last_sync_at > 0
+
+    def start(self):
+        if platform.system() != "Linux":
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="neigh-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    # --- 索引维护 ---
+    def _put(self, key: NeighKey, mac: str):
+        old = self._by_addr.get(key)
+        if old == mac:
+            return False
+        if old is not None:
+            self._drop(key)
+        self._by_addr[key] = mac
+        self._by_mac.setdefault(mac, set()).add(key)
+        return True
+
+    def _drop(self, key: NeighKey) -> Optional[str]:
+        """删除一条邻居，返回其 MAC（不存在时返回 None）"""
+        mac = self._by_addr.pop(key, None)
+        if mac is None:
+            return None
+        keys = self._by_mac.get(mac)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_mac[mac]
+        return mac
+
+    def _apply(self, msg) -> Optional[Tuple[str, NeighKey, str]]:
+        """处理一条邻居消息，索引变化时返回 (动作, 键, MAC)"""
+        addr = msg.get_attr('NDA_DST')
+        if not addr:
+            return None
+        key = (msg['ifindex'], msg['family'], addr)
+        mac = msg.get_attr('NDA_LLADDR')
+        if msg['event'] == 'RTM_DELNEIGH' or not mac or msg['state'] & (NUD_INCOMPLETE | NUD_FAILED):
+            mac = self._drop(key)
+            return ("remove", key, mac) if mac else None
+        mac = mac.lower()
+        return ("add", key, mac) if self._put(key, mac) else None
+
+    def _changed(self):
+        self.version += 1
+        self._ipv6_views = {}
+
+    def _notify_reachable(self, messages):
+        callback = self.on_reachable
+        if callback is None:
+            return
+        for msg in messages:
+            mac = msg.get_attr('NDA_LLADDR')
+            if mac and msg['event'] != 'RTM_DELNEIGH' and msg['state'] & NUD_REACHABLE:
+                try:
+                    callback(mac.lower())
+                except Exception as e:
+                    logger.error(f"邻居可达回调执行失败: {e}")
+
+    def _resync(self):
+        start = time.perf_counter()
+        with iproute() as ipr:
+            self._ifindexes = {link.get_attr('IFLA_IFNAME'): link['index'] for link in ipr.get_links()}
+            self._missing_ifaces = set()
+            self.ifindex = self._ifindexes.get(self.iface)
+            messages = list(ipr.neigh('dump'))
+        neighbor_dump_seconds.observe(time.perf_counter() - start)
+        with self._lock:
+            self._by_addr.clear()
+            self._by_mac.clear()
+            for msg in messages:
+                self._apply(msg)
+            self._changed()
+        self.last_sync_at = time.time()
+        self.resyncs += 1
+        self._notify_reachable(messages)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with iproute() as ipr:
+                    ipr.bind(groups=RTMGRP_NEIGH)
+                    self._resync()
+                    logger.info(f"邻居表缓存已同步：{len(self._by_addr)} 条")
+                    while not self._stop.is_set():
+                        if time.time() - self.last_sync_at >= self.resync_interval:
+                            self._resync()
+                        ready, _, _ = select.select([ipr], [], [], 1.0)
+                        if not ready:
+                            continue
+                        messages = list(ipr.get())
+                        now = time.time()
+                        with self._lock:
+                            changes = [c for c in map(self._apply, messages) if c is not None]
+                            if changes:
+                                self._changed()
+                        self._count_events(len(messages), now)
+                        self._notify_reachable(messages)
+                        if changes and event_bus.active:
+                            self._publish(changes)
+            except Exception as e:
+                # 如 ENOBUFS（事件溢出），重新订阅并全量同步
+                logger.error(f"邻居表订阅异常，将重新同步: {e}")
+                self._stop.wait(1)
+
+    def _publish(self, changes):
+        """推送邻居出现/消失事件（全量同步不推送）"""
+        names = {index: name for name, index in self._ifindexes.items()}
+        for action, (ifindex, family, addr), mac in changes:
+            event_bus.publish("neighbor", action=action, mac=mac, addr=addr,
+                              family="ipv6" if family == socket.AF_INET6 else "ipv4",
+                              iface=names.get(ifindex, ifindex))
+
+    def _count_events(self, n: int, now: float):
+        second = int(now)
+        i = second % 60
+        if self._rate_seconds[i] != second:
+            self._rate_seconds[i] = second
+            self._rate_counts[i] = 0
+        self._rate_counts[i] += n
+        self.events += n
+        self.last_event_at = now
+
+    # --- 查询 ---
+    def lookup_mac(self, mac: str) -> List[NeighKey]:
+        with self._lock:
+            return list(self._by_mac.get(mac.lower(), ()))
+
+    def lookup_addr(self, addr: str, family: int = socket.AF_INET6, ifindex: Optional[int] = None) -> Optional[str]:
+        if ifindex is None:
+            ifindex = self.ifindex
+        with self._lock:
+            return self._by_addr.get((ifindex, family, addr))
+
+    def get_ifindex(self, iface: str) -> Optional[int]:
+        ifindex = self._ifindexes.get(iface)
+        if ifindex is None and iface not in self._missing_ifaces:
+            # 上次同步之后新建的网卡
+            with iproute() as ipr:
+                links = ipr.link_lookup(ifname=iface)
+            if links:
+                ifindex = self._ifindexes[iface] = links[0]
+            else:
+                self._missing_ifaces.add(iface)
+        return ifindex
+
+    def ipv6_neighbors(self, iface: Optional[str] = None) -> List[IPv6Neighbor]:
+        """网卡上的 IPv6 链路本地邻居；邻居表未变化时直接返回上次的结果"""
+        iface = iface or self.iface
+        view = self._ipv6_views.get(iface)
+        if view is not None:
+            return view
+        target = self.get_ifindex(iface)
+        if target is None:
+            return []
+        with self._lock:
+            view = [
+                IPv6Neighbor(local_ipv6=addr, mac=mac)
+                for (ifindex, family, addr), mac in self._by_addr.items()
+                if ifindex == target and family == socket.AF_INET6 and addr.startswith('fe80')
+            ]
+            self._ipv6_views[iface] = view
+        return view
+
+    def stats(self) -> dict:
+        now = time.time()
+        recent = sum(n for n, sec in zip(self._rate_counts, self._rate_seconds) if now - sec < 60)
+        with self._lock:
+            entries = len(self._by_addr)
+            macs = len(self._by_mac)
+        return {
+            "running": self.running,
+            "entries": entries,
+            "macs": macs,
+            "events_total": self.events,
+            "events_per_second": recent / 60,
+            "resyncs": self.resyncs,
+            "last_event_at": self.last_event_at or None,
+            "last_sync_at": self.last_sync_at or None,
+            "seconds_since_event": now - self.last_event_at if self.last_event_at else None,
+            "seconds_since_sync": now - self.last_sync_at if self.last_sync_at else None,
+        }
+
+
+neighbor_cache = NeighborCache()
+
+
+def get_ipv6_neighs(iface: str = IFACE) -> List[IPv6Neighbor]:
+    if neighbor_cache.running:
+        return neighbor_cache.ipv6_neighbors(iface)
+    return _dump_ipv6_neighs(iface)
+
+
+def _dump_ipv6_neighs(iface: str = IFACE) -> List[IPv6Neighbor]:
     if platform.system() != "Linux":
         return []
     result = []
+    start = time.perf_counter()
     try:
-        with IPRoute() as ipr:
+        with iproute() as ipr:
             # 获取网卡索引
-            links = ipr.link_lookup(ifname=IFACE)
+            links = ipr.link_lookup(ifname=iface)
             if not links:
                 return []
             idx = links[0]
@@ -40,15 +298,149 @@ def get_ipv6_neighs() -> List[IPv6Neighbor]:
         # 记录日志或处理 Linux 下权限不足等问题
         logger.error(f"Error accessing netlink: {e}")
 
+    neighbor_dump_seconds.observe(time.perf_counter() - start)
+    return result
+
+
+def _dump_ipv4_neighs(iface: str) -> Dict[str, str]:
+    if platform.system() != "Linux":
+        return {}
+    result = {}
+    try:
+        with iproute() as ipr:
+            links = ipr.link_lookup(ifname=iface)
+            if not links:
+                return {}
+            for neigh in ipr.get_neighbours(ifindex=links[0], family=socket.AF_INET):
+                ip = neigh.get_attr('NDA_DST')
+                mac = neigh.get_attr('NDA_LLADDR')
+                if ip and mac and not neigh['state'] & (NUD_INCOMPLETE | NUD_FAILED):
+                    result[ip] = mac.lower()
+    except Exception as e:
+        logger.error(f"Error accessing netlink: {e}")
     return result
 
 
-def ipv4_to_mac(ip, iface):
-    pkt = Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=ip)
-    ans = srp1(pkt, iface=iface, timeout=1, verbose=False)
-    if ans:
-        return ans.hwsrc.lower()
-    return None
+class IPv4Resolver:
+    """
+    IPv4 -> MAC 解析：先查 TTL 缓存，再查内核 ARP 表，最后对剩余地址批量主动 ARP。
+    主动 ARP 一次发出整批请求、共用一个超时，会阻塞调用线程，应在工作线程中调用。
+    """
+
+    def __init__(self, iface: str = IFACE, ttl: float = ARP_CACHE_TTL, negative_ttl: float = ARP_NEGATIVE_TTL):
+        self.iface = iface
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache: Dict[str, Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, ip: str, now: float) -> Tuple[bool, Optional[str]]:
+        hit = self._cache.get(ip)
+        if hit is None or hit[1] < now:
+            return False, None
+        return True, hit[0]
+
+    def _store(self, ip: str, mac: Optional[str], now: float):
+        self._cache[ip] = (mac, now + (self.ttl if mac else self.negative_ttl))
+
+    def _prune(self, now: float):
+        for ip in [ip for ip, (_, expires) in self._cache.items() if expires < now]:
+            del self._cache[ip]
+
+    def resolve_many(self, ips: List[str], timeout: float = 1.0) -> Dict[str, Optional[str]]:
+        now = time.monotonic()
+        result: Dict[str, Optional[str]] = {}
+        missing = []
+        with self._lock:
+            for ip in ips:
+                hit, mac = self._cached(ip, now)
+                if hit:
+                    result[ip] = mac
+                else:
+                    missing.append(ip)
+        if not missing:
+            return result
+
+        # 1. 内核 ARP 表（本解析器所在网卡）
+        ifindex = neighbor_cache.get_ifindex(self.iface) if neighbor_cache.running else None
+        if ifindex is not None:
+            kernel = {}
+            for ip in missing:
+                mac = neighbor_cache.lookup_addr(ip, family=socket.AF_INET, ifindex=ifindex)
+                if mac:
+                    kernel[ip] = mac
+        else:
+            kernel = _dump_ipv4_neighs(self.iface)
+        still_missing = []
+        with self._lock:
+            for ip in missing:
+                mac = kernel.get(ip)
+                if mac:
+                    result[ip] = mac
+                    self._store(ip, mac, now)
+                else:
+                    still_missing.append(ip)
+        if not still_missing:
+            return result
+
+        # 2. 批量主动 ARP
+        answered = {}
+        try:
+            pkts = [Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=ip) for ip in still_missing]
+            from scapy.sendrecv import srp
+            ans, _ = srp(pkts, iface=self.iface, timeout=timeout, verbose=False)
+            for _req, reply in ans:
+                answered[reply.psrc] = reply.hwsrc.lower()
+        except Exception as e:
+            logger.error(f"主动 ARP 失败: {e}")
+        now = time.monotonic()
+        with self._lock:
+            for ip in still_missing:
+                mac = answered.get(ip)
+                result[ip] = mac
+                self._store(ip, mac, now)
+            if len(self._cache) > 4 * ARP_MAX_SWEEP:
+                self._prune(now)
+        return result
+
+    def resolve_cidr(self, cidr: str, timeout: float = 1.0) -> Dict[str, Optional[str]]:
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        if network.num_addresses > ARP_MAX_SWEEP:
+            raise ValueError(f"网段过大，最多扫描 {ARP_MAX_SWEEP} 个地址")
+        return self.resolve_many([str(ip) for ip in network.hosts()], timeout=timeout)
+
+    def resolve_bulk(self, ips: List[str], cidr: Optional[str] = None,
+                     timeout: float = 1.0) -> Dict[str, Optional[str]]:
+        """地址列表与网段合并去重后一次解析；地址非法或总数超过 ARP_MAX_SWEEP 时抛出 ValueError，不发送任何 ARP"""
+        targets = dict.fromkeys(str(ipaddress.IPv4Address(ip)) for ip in ips)
+        if len(targets) > ARP_MAX_SWEEP:
+            raise ValueError(f"地址过多，最多解析 {ARP_MAX_SWEEP} 个地址")
+        if cidr:
+            network = ipaddress.IPv4Network(cidr, strict=False)
+            if network.num_addresses + len(targets) > ARP_MAX_SWEEP:
+                raise ValueError(f"网段过大，最多扫描 {ARP_MAX_SWEEP} 个地址")
+            targets.update(dict.fromkeys(str(ip) for ip in network.hosts()))
+        return self.resolve_many(list(targets), timeout=timeout)
+
+
+# 每个网卡一个解析器，各自保留 TTL 缓存
+_ipv4_resolvers: Dict[str, IPv4Resolver] = {}
+_ipv4_resolvers_lock = threading.Lock()
+
+
+def get_ipv4_resolver(iface: str = IFACE) -> IPv4Resolver:
+    resolver = _ipv4_resolvers.get(iface)
+    if resolver is None:
+        with _ipv4_resolvers_lock:
+            resolver = _ipv4_resolvers.setdefault(iface, IPv4Resolver(iface=iface))
+    return resolver
+
+
+ipv4_resolver = get_ipv4_resolver(IFACE)
+
+
+def ipv4_to_mac(ip, iface=IFACE):
+    return get_ipv4_resolver(iface).resolve_many([ip]).get(ip)
 
 if __name__=="__main__":
     print(get_ipv6_neighs())
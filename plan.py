@@ -0,0 +1,421 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select
+
+from config import RA_lifetime, RA_interval, IFACE, PREFIX, PREFIX_DEPRECATE_TIME
+from data.database import engine
+from gateway_select import select_gateway
+from models import Device, Gateway, Tag
+from ra_cache import frame_cache, resolve_pending_iface_macs, RAOptions
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlanEntry:
+    mac: str
+    tag_id: int
+    gateway_mac: str
+    gateway_lla: str
+    dns: List[str]
+    frame: bytes
+    iface: str = IFACE
+
+
+@dataclass
+class PlanChange:
+    mac: str
+    old: Optional[PlanEntry]
+    new: Optional[PlanEntry]
+
+    @property
+    def gateway_changed(self) -> bool:
+        """网关、网关链路本地地址（设备以其作为默认路由器）或所在网卡发生变化"""
+        old_gw = (self.old.gateway_mac, self.old.gateway_lla, self.old.iface) if self.old else None
+        new_gw = (self.new.gateway_mac, self.new.gateway_lla, self.new.iface) if self.new else None
+        return old_gw != new_gw
+
+
+def normalize_mac(mac: str) -> str:
+    return mac.replace('-', ':').lower()
+
+
+def _copy(obj):
+    """脱离 Session 的副本，避免提交后属性过期"""
+    return type(obj)(**obj.model_dump())
+
+
+class AdvertisementPlan:
+    """
+    内存中的通告计划：设备 -> (网关, DNS, 帧)。
+    启动时从数据库加载一次，之后由 CRUD 钩子增量修补，调度器热路径不再访问 SQLite。
+    """
+
+    def __init__(self):
+        self.devices: Dict[str, Device] = {}
+        self.gateways: Dict[str, Gateway] = {}
+        self.tags: Dict[int, Tag] = {}
+        self.entries: Dict[str, PlanEntry] = {}
+        # 规范化 MAC -> 数据库中的 MAC，用于按抓包得到的地址查找
+        self._by_norm: Dict[str, str] = {}
+        # 健康检查判定为不可用的网关，不参与选择
+        self.unhealthy: set = set()
+        # 未单独指定前缀的标签使用的前缀，以及已被替换、仍需以 preferred lifetime 0 通告的旧前缀 -> 过期时间
+        self.prefix: str = PREFIX
+        self.deprecated: Dict[str, float] = {}
+        self.version = 0
+        self._lock = threading.RLock()
+        self._changes: Optional[Dict[str, Optional[PlanEntry]]] = None
+        self._groups: Optional[Dict[tuple, List[bytes]]] = None
+        self._groups_version = None
+
+    # --- 加载 ---
+    def load(self, session: Optional[Session] = None):
+        if session is None:
+            with Session(engine) as session:
+                return self.load(session)
+
+        devices = session.exec(select(Device)).all()
+        gateways = session.exec(select(Gateway)).all()
+        tags = session.exec(select(Tag)).all()
+        with self._lock:
+            self.devices = {d.mac: _copy(d) for d in devices}
+            self.gateways = {g.mac: _copy(g) for g in gateways}
+            self.tags = {t.tag_id: _copy(t) for t in tags}
+            self.entries = {}
+            self._by_norm = {normalize_mac(mac): mac for mac in self.devices}
+            for mac in self.devices:
+                self._recompute(mac)
+            self.version += 1
+            frame_cache.prune(self.devices)
+        logger.info(f"通告计划已加载：{len(self.devices)} 个设备，{len(self.gateways)} 个网关，{len(self.tags)} 个标签")
+
+    def rebuild(self) -> List[PlanChange]:
+        """不访问数据库，按当前内存数据重新计算全部条目"""
+        with self._lock:
+            self._begin()
+            for mac in self.devices:
+                self._recompute(mac)
+            self.version += 1
+            return self._collect()
+
+    # --- 计算 ---
+    def tag_iface(self, tag_id) -> str:
+        tag = self.tags.get(tag_id)
+        return (tag.iface if tag else None) or IFACE
+
+    def tag_interval(self, tag_id) -> float:
+        tag = self.tags.get(tag_id)
+        return (tag.ra_interval if tag else None) or RA_interval
+
+    def intervals(self) -> List[float]:
+        """所有标签的发送间隔（含默认间隔）"""
+        with self._lock:
+            return sorted({RA_interval} | {self.tag_interval(tag_id) for tag_id in self.tags})
+
+    @staticmethod
+    def _tag_options(tag: Optional[Tag]) -> RAOptions:
+        if tag is None:
+            return RAOptions()
+        return RAOptions(
+            managed=bool(tag.managed),
+            other=bool(tag.other),
+            prefix_len=tag.prefix_len or 64,
+            mtu=tag.mtu or None,
+            routes=tuple(tag.routes or ()),
+        )
+
+    def _tag_gateways(self, tag_id) -> List[Gateway]:
+        return [gw for gw in self.gateways.values()
+                if gw.tag_id == tag_id and gw.mac not in self.unhealthy]
+
+    def _recompute(self, mac: str, gateways_list: Optional[List[Gateway]] = None):
+        if self._changes is not None and mac not in self._changes:
+            self._changes[mac] = self.entries.get(mac)
+        device = self.devices.get(mac)
+        if device is None:
+            self.entries.pop(mac, None)
+            frame_cache.invalidate(mac)
+            return
+
+        if gateways_list is None:
+            gateways_list = self._tag_gateways(device.tag_id)
+        # 加权 rendezvous 哈希负载均衡
+        gateway = select_gateway(mac, gateways_list)
+        if gateway is None:
+            self.entries.pop(mac, None)
+            return
+
+        # 获取该设备所在 tag 的 DNS、网卡与前缀
+        tag = self.tags.get(device.tag_id)
+        dns_servers = list(tag.dns) if tag else []
+        iface = self.tag_iface(device.tag_id)
+        if tag and tag.prefix:
+            prefix, deprecated = tag.prefix, ()
+        else:
+            prefix, deprecated = self.prefix, tuple(sorted(self.deprecated))
+
+        try:
+            frame = frame_cache.get(
+                dst_mac=mac,
+                src_mac=gateway.mac,
+                src_lla=gateway.local_ipv6,
+                dns=dns_servers,
+                router_lifetime=(tag.ra_lifetime if tag else None) or RA_lifetime,
+                prefix=prefix,
+                iface=iface,
+                deprecated=deprecated,
+                options=self._tag_options(tag)
+            )
+        except Exception as e:
+            # 单个设备的参数有误（如数据库中的旧数据）时跳过该设备，不影响其他设备
+            logger.error(f"设备 {mac} 的 RA 构造失败，已跳过: {e}")
+            self.entries.pop(mac, None)
+            return
+        self.entries[mac] = PlanEntry(
+            mac=mac,
+            tag_id=device.tag_id,
+            gateway_mac=gateway.mac,
+            gateway_lla=gateway.local_ipv6,
+            dns=dns_servers,
+            frame=frame,
+            iface=iface
+        )
+
+    def _recompute_tag(self, tag_id):
+        gateways_list = self._tag_gateways(tag_id)
+        for mac, device in self.devices.items():
+            if device.tag_id == tag_id:
+                self._recompute(mac, gateways_list)
+
+    # --- 变更跟踪 ---
+    def _begin(self):
+        self._changes = {}
+
+    def _collect(self) -> List[PlanChange]:
+        changes = [
+            PlanChange(mac=mac, old=old, new=self.entries.get(mac))
+            for mac, old in self._changes.items()
+        ]
+        self._changes = None
+        return [c for c in changes if c.gateway_changed]
+
+    # --- CRUD 钩子 ---
+    def on_change(self, action: str, id_val, obj=None) -> List[PlanChange]:
+        """
+        由 CRUDService 在提交后调用。
+        action 为 create/update/delete；delete 时 obj 为被删除前的副本。
+        返回网关发生变化的设备列表。
+        """
+        if obj is None:
+            return []
+        obj = _copy(obj)
+        with self._lock:
+            self._begin()
+            try:
+                if isinstance(obj, Device):
+                    self._on_device(action, id_val, obj)
+                elif isinstance(obj, Gateway):
+                    self._on_gateway(action, id_val, obj)
+                elif isinstance(obj, Tag):
+                    self._on_tag(action, id_val, obj)
+            except Exception:
+                # 不留下未收集的变更记录，后续 _begin 重新开始
+                self._changes = None
+                raise
+            self.version += 1
+            return self._collect()
+
+    def on_bulk_change(self, objs: list) -> List[PlanChange]:
+        """
+        由 CRUDService 在批量导入提交后调用（均为新增或更新）。
+        先写入全部对象，再让每个受影响的标签/设备只重新计算一次，版本号只增加一次。
+        """
+        if not objs:
+            return []
+        objs = [_copy(obj) for obj in objs]
+        with self._lock:
+            self._begin()
+            try:
+                tags, macs = set(), set()
+                for obj in objs:
+                    if isinstance(obj, Device):
+                        self.devices[obj.mac] = obj
+                        self._by_norm[normalize_mac(obj.mac)] = obj.mac
+                        macs.add(obj.mac)
+                    elif isinstance(obj, Gateway):
+                        old = self.gateways.get(obj.mac)
+                        if old is not None:
+                            tags.add(old.tag_id)
+                        self.gateways[obj.mac] = obj
+                        tags.add(obj.tag_id)
+                    elif isinstance(obj, Tag):
+                        self.tags[obj.tag_id] = obj
+                        tags.add(obj.tag_id)
+                for tag_id in tags:
+                    self._recompute_tag(tag_id)
+                for mac in macs:
+                    if self.devices[mac].tag_id not in tags:
+                        self._recompute(mac)
+            except Exception:
+                self._changes = None
+                raise
+            self.version += 1
+            return self._collect()
+
+    def set_gateway_health(self, gateway_mac: str, healthy: bool) -> List[PlanChange]:
+        """更新网关健康状态并重新分配受影响的设备"""
+        with self._lock:
+            if healthy == (gateway_mac not in self.unhealthy):
+                return []
+            if healthy:
+                self.unhealthy.discard(gateway_mac)
+            else:
+                self.unhealthy.add(gateway_mac)
+            gateway = self.gateways.get(gateway_mac)
+            if gateway is None:
+                return []
+            self._begin()
+            self._recompute_tag(gateway.tag_id)
+            self.version += 1
+            return self._collect()
+
+    def set_prefix(self, prefix: str) -> bool:
+        """切换默认前缀，旧前缀转为弃用；返回前缀是否变化"""
+        with self._lock:
+            if prefix == self.prefix:
+                return False
+            old, self.prefix = self.prefix, prefix
+            self.deprecated.pop(prefix, None)
+            self.deprecated[old] = time.monotonic() + PREFIX_DEPRECATE_TIME
+            self.rebuild()
+        logger.warning(f"前缀已由 {old} 变为 {prefix}，旧前缀将以 preferred lifetime 0 通告 {PREFIX_DEPRECATE_TIME} 秒")
+        return True
+
+    def expire_deprecated(self) -> bool:
+        """移除已过期的弃用前缀；返回是否有变化"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [p for p, expires in self.deprecated.items() if expires <= now]
+            if not expired:
+                return False
+            for p in expired:
+                del self.deprecated[p]
+            self.rebuild()
+        logger.info(f"已停止通告旧前缀 {', '.join(expired)}")
+        return True
+
+    def refresh_iface_macs(self) -> bool:
+        """之前未能获取 MAC 的网卡解析成功后，用真实 MAC 作为以太网源地址重建全部帧；返回是否有变化"""
+        resolved = resolve_pending_iface_macs()
+        if not resolved:
+            return False
+        self.rebuild()
+        logger.info(f"网卡 {', '.join(resolved)} 的 MAC 已解析，已重建 RA 帧")
+        return True
+
+    def _on_device(self, action, id_val, device: Device):
+        if id_val in self.devices and id_val != device.mac:
+            # 主键被修改
+            self.devices.pop(id_val)
+            self._by_norm.pop(normalize_mac(id_val), None)
+            self._recompute(id_val)
+        if action == "delete":
+            self.devices.pop(device.mac, None)
+            self._by_norm.pop(normalize_mac(device.mac), None)
+        else:
+            self.devices[device.mac] = device
+            self._by_norm[normalize_mac(device.mac)] = device.mac
+        self._recompute(device.mac)
+
+    def _on_gateway(self, action, id_val, gateway: Gateway):
+        affected = {gateway.tag_id}
+        old = self.gateways.pop(id_val, None)
+        if old is not None:
+            affected.add(old.tag_id)
+        if action != "delete":
+            self.gateways[gateway.mac] = gateway
+        else:
+            self.unhealthy.discard(gateway.mac)
+        for tag_id in affected:
+            self._recompute_tag(tag_id)
+
+    def _on_tag(self, action, id_val, tag: Tag):
+        if action == "delete":
+            self.tags.pop(tag.tag_id, None)
+        else:
+            self.tags[tag.tag_id] = tag
+        self._recompute_tag(tag.tag_id)
+
+    # --- 热路径 ---
+    def frames(self) -> List[bytes]:
+        with self._lock:
+            return [entry.frame for entry in self.entries.values()]
+
+    def gateway_list(self, iface: Optional[str] = None) -> List[Gateway]:
+        with self._lock:
+            return [gw for gw in self.gateways.values()
+                    if iface is None or self.tag_iface(gw.tag_id) == iface]
+
+    def interfaces(self) -> List[str]:
+        """所有标签使用的网卡（至少包含默认网卡）"""
+        with self._lock:
+            return sorted({IFACE} | {self.tag_iface(tag_id) for tag_id in self.tags})
+
+    def find(self, mac: str) -> Optional[PlanEntry]:
+        """按任意格式的 MAC 查找设备的通告条目"""
+        key = self._by_norm.get(normalize_mac(mac))
+        return self.entries.get(key) if key is not None else None
+
+    def macs(self) -> List[str]:
+        with self._lock:
+            return list(self.entries)
+
+    def groups(self) -> Dict[tuple, List[bytes]]:
+        """按 (网卡, tag_id, 网关MAC) 分组的帧，计划未变化时复用上次结果"""
+        with self._lock:
+            if self._groups is None or self._groups_version != self.version:
+                groups: Dict[tuple, List[bytes]] = {}
+                for entry in self.entries.values():
+                    groups.setdefault((entry.iface, entry.tag_id, entry.gateway_mac), []).append(entry.frame)
+                self._groups = groups
+                self._groups_version = self.version
+            return self._groups
+
+    def snapshot(self) -> List[PlanEntry]:
+        with self._lock:
+            return list(self.entries.values())
+
+    # --- 一致性检查 ---
+    def verify(self, session: Session) -> dict:
+        """将内存计划与数据库现状对比，返回差异"""
+        fresh = AdvertisementPlan()
+        fresh.prefix = self.prefix
+        fresh.deprecated = dict(self.deprecated)
+        fresh.unhealthy = set(self.unhealthy)
+        fresh.load(session)
+        with self._lock:
+            current = {mac: (e.gateway_mac, e.dns, e.frame) for mac, e in self.entries.items()}
+        expected = {mac: (e.gateway_mac, e.dns, e.frame) for mac, e in fresh.entries.items()}
+
+        missing = sorted(set(expected) - set(current))
+        extra = sorted(set(current) - set(expected))
+        mismatched = sorted(
+            mac for mac in set(current) & set(expected) if current[mac] != expected[mac]
+        )
+        consistent = not (missing or extra or mismatched)
+        if not consistent:
+            logger.warning(f"通告计划与数据库不一致：缺失 {len(missing)}，多余 {len(extra)}，不匹配 {len(mismatched)}")
+        return {
+            "consistent": consistent,
+            "missing": missing,
+            "extra": extra,
+            "mismatched": mismatched,
+        }
+
+
+plan = AdvertisementPlan()
@@ -0,0 +1,125 @@
+import ipaddress
+import logging
+import platform
+import select
+import socket
+import threading
+import time
+from typing import Optional, Set
+
+from config import PREFIX_SOURCE
+from events import event_bus
+from neigh import iproute, RTMGRP_IPV6_IFADDR
+from plan import plan
+from utils import daemon
+
+logger = logging.getLogger(__name__)
+
+IFA_F_TEMPORARY = 0x01
+IFA_F_DEPRECATED = 0x20
+IFA_F_TENTATIVE = 0x40
+RT_SCOPE_UNIVERSE = 0
+
+# 地址事件往往成批到达（旧地址删除、新地址添加），稍等片刻再判断
+SETTLE_TIME = 0.5
+
+
+def to_prefix(address: str) -> str:
+    """地址所在的 /64，格式与 config.PREFIX 相同"""
+    return str(ipaddress.IPv6Network(f"{address}/64", strict=False).network_address)
+
+
+class PrefixWatcher:
+    """
+    通过 netlink 订阅 IPv6 地址事件（RTM_NEWADDR/RTM_DELADDR），跟踪 PREFIX_SOURCE 网卡上全局地址的 /64。
+    前缀变化时更新通告计划（旧前缀转为弃用）并立即发送一轮 RA，无需重启；
+    弃用前缀到期后自动停止通告。
+    """
+
+    def __init__(self, iface: Optional[str] = PREFIX_SOURCE):
+        self.iface = iface
+        self.changes = 0
+        self.last_change_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if platform.system() != "Linux" or not self.iface:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="prefix-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _prefixes(self) -> Set[str]:
+        with iproute() as ipr:
+            links = ipr.link_lookup(ifname=self.iface)
+            if not links:
+                return set()
+            messages = ipr.get_addr(family=socket.AF_INET6, index=links[0])
+        result = set()
+        for msg in messages:
+            flags = msg.get_attr('IFA_FLAGS') or msg['flags']
+            address = msg.get_attr('IFA_ADDRESS')
+            if (not address or msg['scope'] != RT_SCOPE_UNIVERSE
+                    or flags & (IFA_F_TEMPORARY | IFA_F_DEPRECATED | IFA_F_TENTATIVE)):
+                continue
+            result.add(to_prefix(address))
+        return result
+
+    def check(self) -> bool:
+        """根据网卡当前地址更新前缀；返回前缀是否变化"""
+        prefixes = self._prefixes()
+        if not prefixes or plan.prefix in prefixes:
+            return False
+        # 有多个候选时优先全局单播地址，其次 ULA
+        prefix = sorted(prefixes, key=lambda p: (not ipaddress.IPv6Address(p).is_global, p))[0]
+        return self.apply(prefix)
+
+    def apply(self, prefix: str) -> bool:
+        """切换到新前缀并立即向所有设备通告（也供外部脚本通过 API 调用）"""
+        if not plan.set_prefix(prefix):
+            return False
+        self.changes += 1
+        self.last_change_at = time.time()
+        event_bus.publish("prefix", prefix=prefix, deprecated=list(plan.deprecated))
+        daemon()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with iproute() as ipr:
+                    ipr.bind(groups=RTMGRP_IPV6_IFADDR)
+                    self.check()
+                    logger.info(f"已开始跟踪网卡 {self.iface} 的 IPv6 前缀，当前前缀 {plan.prefix}")
+                    while not self._stop.is_set():
+                        ready, _, _ = select.select([ipr], [], [], 1.0)
+                        if not ready:
+                            continue
+                        ipr.get()
+                        self._stop.wait(SETTLE_TIME)
+                        while select.select([ipr], [], [], 0)[0]:
+                            ipr.get()
+                        self.check()
+            except Exception as e:
+                logger.error(f"前缀跟踪异常，将重新订阅: {e}")
+                self._stop.wait(1)
+
+    def to_dict(self) -> dict:
+        now = time.monotonic()
+        return {
+            "source": self.iface,
+            "prefix": plan.prefix,
+            "deprecated": {p: max(0.0, expires - now) for p, expires in plan.deprecated.items()},
+            "changes": self.changes,
+            "last_change_at": self.last_change_at or None,
+        }
+
+
+prefix_watcher = PrefixWatcher()
@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from config import PRESENCE, PRESENCE_TIMEOUT, PRESENCE_MAX_INTERVAL, RA_interval
+from events import event_bus
+from history import history
+from metrics import ra_sent_total, ra_failed_total, presence_devices
+from plan import plan, normalize_mac, PlanEntry
+from rawsock import senders
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """
+    设备在线检测：邻居表中确认可达或发送过 RS 的设备视为在线，超过 timeout 秒未出现则视为离线。
+    离线设备的 RA 按指数退避发送（所在标签的发送间隔、2 倍、4 倍……最长 max_interval），
+    重新出现时立即发送 RA 并恢复正常周期。启动后的第一个 timeout 内所有设备视为在线。
+    """
+
+    def __init__(self, enabled: bool = PRESENCE, timeout: float = PRESENCE_TIMEOUT,
+                 max_interval: float = PRESENCE_MAX_INTERVAL):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.max_interval = max_interval
+        self._last_seen: Dict[str, float] = {}
+        # 离线设备：规范化 MAC -> (下次发送时间, 当前退避间隔)
+        self._backoff: Dict[str, Tuple[float, float]] = {}
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self.reappeared = 0
+        self.last_pass = {"sent": 0, "skipped": 0}
+
+    def _present(self, mac: str, now: float) -> bool:
+        last = self._last_seen.get(mac)
+        if last is None:
+            return now - self._started < self.timeout
+        return now - last < self.timeout
+
+    def seen(self, mac: str, announce: bool = True):
+        """设备出现；若此前离线且 announce 为 True，立即发送其 RA"""
+        mac = normalize_mac(mac)
+        now = time.monotonic()
+        with self._lock:
+            was_present = self._present(mac, now)
+            self._last_seen[mac] = now
+            self._backoff.pop(mac, None)
+        if was_present:
+            return
+        entry = plan.find(mac)
+        if entry is None:
+            return
+        self.reappeared += 1
+        event_bus.publish("presence", mac=mac, present=True)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[+] 设备 %s 重新上线", mac)
+        if announce:
+            self._announce(entry)
+
+    def _announce(self, entry: PlanEntry):
+        if not senders.allowed():
+            return
+        ok = senders.get(entry.iface).send(entry.frame)
+        history.record_frames(entry.iface, entry.tag_id, entry.gateway_mac, "presence", (entry.frame,), ok)
+        event_bus.publish("ra", mac=entry.mac, iface=entry.iface, tag=entry.tag_id, gateway=entry.gateway_mac,
+                          trigger="presence", ok=ok)
+        if ok:
+            ra_sent_total.inc(tag=entry.tag_id, gateway=entry.gateway_mac, trigger="presence")
+        else:
+            ra_failed_total.inc(tag=entry.tag_id, gateway=entry.gateway_mac, trigger="presence")
+
+    def due(self, mac: str, now: float, interval: float = RA_interval) -> bool:
+        """设备本轮是否应发送：在线设备总是发送，离线设备按退避计划发送"""
+        if not self.enabled:
+            return True
+        mac = normalize_mac(mac)
+        with self._lock:
+            if self._present(mac, now):
+                return True
+            next_send, backoff = self._backoff.get(mac, (0.0, interval))
+            if now < next_send:
+                return False
+            self._backoff[mac] = (now + backoff, min(backoff * 2, self.max_interval))
+            return True
+
+    def select(self, entries: Iterable[PlanEntry]) -> Tuple[Dict[tuple, List[bytes]], int]:
+        """按在线状态筛选整轮发送的帧，返回 (分组帧, 跳过的设备数)"""
+        now = time.monotonic()
+        groups: Dict[tuple, List[bytes]] = {}
+        skipped = 0
+        intervals: Dict[int, float] = {}
+        for entry in entries:
+            interval = intervals.get(entry.tag_id)
+            if interval is None:
+                interval = intervals[entry.tag_id] = plan.tag_interval(entry.tag_id)
+            if self.due(entry.mac, now, interval):
+                groups.setdefault((entry.iface, entry.tag_id, entry.gateway_mac), []).append(entry.frame)
+            else:
+                skipped += 1
+        return groups, skipped
+
+    def record_pass(self, sent: int, skipped: int):
+        self.last_pass = {"sent": sent, "skipped": skipped}
+
+    def counts(self) -> Dict[str, int]:
+        now = time.monotonic()
+        macs = plan.macs()
+        with self._lock:
+            present = sum(1 for mac in macs if self._present(normalize_mac(mac), now))
+            # 清理已不在计划中的设备
+            if len(self._last_seen) > 4 * max(len(macs), 256):
+                active = {normalize_mac(mac) for mac in macs}
+                self._last_seen = {m: t for m, t in self._last_seen.items() if m in active}
+                self._backoff = {m: b for m, b in self._backoff.items() if m in active}
+        counts = {"present": present, "absent": len(macs) - present}
+        for state, n in counts.items():
+            presence_devices.set(n, state=state)
+        return counts
+
+    def to_dict(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "timeout": self.timeout,
+            "max_interval": self.max_interval,
+            **self.counts(),
+            "reappeared": self.reappeared,
+            "last_pass": self.last_pass,
+        }
+
+
+presence = PresenceTracker()
@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from scapy.arch import get_if_hwaddr
+from scapy.layers.inet6 import ICMPv6ND_RA, ICMPv6NDOptPrefixInfo, ICMPv6NDOptSrcLLAddr, IPv6, ICMPv6NDOptRDNSS, \
+    ICMPv6NDOptMTU, ICMPv6NDOptRouteInfo
+from scapy.layers.l2 import Ether
+
+from config import PREFIX, IFACE, RA_lifetime
+
+logger = logging.getLogger(__name__)
+
+_iface_macs: Dict[str, str] = {}
+_iface_mac_failed_at: Dict[str, float] = {}
+IFACE_MAC_RETRY = 60
+
+
+def get_iface_mac(iface: str = IFACE) -> Optional[str]:
+    """获取发包网卡的真实 MAC（以太网源地址），每个网卡只解析一次；失败后每 IFACE_MAC_RETRY 秒重试"""
+    mac = _iface_macs.get(iface)
+    if mac is None:
+        failed_at = _iface_mac_failed_at.get(iface)
+        if failed_at is not None and time.monotonic() - failed_at < IFACE_MAC_RETRY:
+            return None
+        try:
+            mac = _iface_macs[iface] = get_if_hwaddr(iface)
+        except Exception as e:
+            if failed_at is None:
+                logger.error(f"无法获取网卡 {iface} 的 MAC: {e}")
+            _iface_mac_failed_at[iface] = time.monotonic()
+        else:
+            if _iface_mac_failed_at.pop(iface, None) is not None:
+                logger.info(f"已获取网卡 {iface} 的 MAC: {mac}")
+    return mac
+
+
+def resolve_pending_iface_macs() -> List[str]:
+    """重试之前解析失败的网卡 MAC（受 IFACE_MAC_RETRY 限制），返回本次解析成功的网卡"""
+    return [iface for iface in list(_iface_mac_failed_at) if get_iface_mac(iface) is not None]
+
+
+class RAOptions(NamedTuple):
+    """RA 中除前缀/DNS 以外的可选参数（按标签配置）"""
+    managed: bool = False  # M 标志：通过 DHCPv6 获取地址
+    other: bool = False  # O 标志：通过 DHCPv6 获取其他配置
+    prefix_len: int = 64
+    mtu: Optional[int] = None  # MTU 选项，为空时不携带
+    routes: Tuple[str, ...] = ()  # Route Information 选项，如 "2001:db8:100::/48"
+
+
+DEFAULT_RA_OPTIONS = RAOptions()
+
+
+def mac_to_bytes(mac: str) -> bytes:
+    return bytes.fromhex(mac.replace(':', '').replace('-', ''))
+
+
+def build_ra(dst_mac, dst_lla, src_mac, src_lla, dns: List[str], router_lifetime: int,
+             real_mac=None, prefix=PREFIX, deprecated: Sequence[str] = (),
+             options: RAOptions = DEFAULT_RA_OPTIONS) -> bytes:
+    """
+    构造单播 RA 并序列化为完整以太网帧（含校验和）
+    deprecated 为已被替换的旧前缀，以 preferred lifetime 0 通告，设备会立即停止用其发起新连接
+    """
+    # 构造以太网头
+    eth = Ether(src=real_mac, dst=dst_mac)
+    # 构造IPv6头：伪造源LLA
+    ip6 = IPv6(src=src_lla, dst=dst_lla)
+    # 构造RA报文
+    ra = ICMPv6ND_RA(chlim=64, M=int(options.managed), O=int(options.other), routerlifetime=router_lifetime)
+    # 构造前缀信息
+    pref = ICMPv6NDOptPrefixInfo(
+        prefix=prefix,
+        prefixlen=options.prefix_len,
+        L=1, #链路内标志
+        A=1, #自主地址配置标志
+        validlifetime=router_lifetime,
+        preferredlifetime=router_lifetime
+    )
+    for old in deprecated:
+        pref = pref / ICMPv6NDOptPrefixInfo(
+            prefix=old,
+            prefixlen=options.prefix_len,
+            L=1,
+            A=1,
+            validlifetime=router_lifetime,
+            preferredlifetime=0
+        )
+    if options.mtu:
+        pref = pref / ICMPv6NDOptMTU(mtu=options.mtu)
+    for route in options.routes:
+        route_prefix, _, plen = route.partition("/")
+        pref = pref / ICMPv6NDOptRouteInfo(prefix=route_prefix, plen=int(plen or 64), rtlifetime=router_lifetime)
+    sll = ICMPv6NDOptSrcLLAddr(lladdr=src_mac)
+    rdnss = ICMPv6NDOptRDNSS(dns=dns, lifetime=router_lifetime)
+    return bytes(eth / ip6 / ra / pref / sll / rdnss)
+
+
+def build_withdrawal(dst_mac, src_mac, src_lla, dst_lla="ff02::1", real_mac=None, iface=IFACE) -> bytes:
+    """构造 router lifetime 为 0 的 RA，让设备立即弃用该网关"""
+    if real_mac is None:
+        real_mac = get_iface_mac(iface)
+    eth = Ether(src=real_mac, dst=dst_mac)
+    ip6 = IPv6(src=src_lla, dst=dst_lla)
+    ra = ICMPv6ND_RA(chlim=64, M=0, O=0, routerlifetime=0)
+    sll = ICMPv6NDOptSrcLLAddr(lladdr=src_mac)
+    return bytes(eth / ip6 / ra / sll)
+
+
+FrameKey = Tuple[str, str, str, Tuple[str, ...], str, int, str, Tuple[str, ...], RAOptions]
+
+
+class FrameCache:
+    """
+    按设备缓存已序列化的 RA 帧。
+    键包含 (设备MAC, 网关MAC, 网关LLA, DNS, 前缀, 生存期, 网卡, 弃用前缀, RA 选项, 网卡真实 MAC)，任一字段变化即视为失效并重建；
+    网卡 MAC 在启动时尚未解析成功的，解析成功后自动重建，不会一直沿用不带以太网源地址的帧；
+    稳态下每轮只需重放缓存中的字节。
+
+    目的 IPv6 固定为 ff02::1，同一网关/DNS 下各设备的帧仅以太网目的 MAC 不同（不参与校验和），
+    因此每种组合只用 scapy 构造一次模板，设备帧由模板替换前 6 字节得到。
+    撤回帧（lifetime 0）同理，每个 (网关MAC, 网关LLA, 网卡) 一个模板。
+    """
+
+    def __init__(self):
+        self._frames: dict[str, Tuple[FrameKey, bytes]] = {}
+        self._templates: dict[tuple, bytes] = {}
+        self._withdrawals: dict[tuple, bytes] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dst_mac: str, src_mac: str, src_lla: str, dns: List[str],
+            router_lifetime: int = RA_lifetime, prefix: str = PREFIX, iface: str = IFACE,
+            deprecated: Sequence[str] = (), options: RAOptions = DEFAULT_RA_OPTIONS) -> bytes:
+        real_mac = get_iface_mac(iface)
+        key = (dst_mac, src_mac, src_lla, tuple(dns), prefix, router_lifetime, iface, tuple(deprecated), options,
+               real_mac)
+        cached = self._frames.get(dst_mac)
+        if cached is not None and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        template_key = key[1:]
+        template = self._templates.get(template_key)
+        if template is None:
+            template = build_ra(
+                dst_mac="00:00:00:00:00:00",
+                dst_lla="ff02::1",
+                src_mac=src_mac,
+                src_lla=src_lla,
+                dns=dns,
+                router_lifetime=router_lifetime,
+                real_mac=real_mac,
+                prefix=prefix,
+                deprecated=deprecated,
+                options=options
+            )
+        frame = mac_to_bytes(dst_mac) + template[6:]
+        with self._lock:
+            self._templates[template_key] = template
+            self._frames[dst_mac] = (key, frame)
+        return frame
+
+    def withdrawal(self, dst_mac: str, src_mac: str, src_lla: str, iface: str = IFACE) -> bytes:
+        """设备的撤回帧：同一网关的撤回模板只构造一次，故障切换时批量撤回不逐个调用 scapy"""
+        real_mac = get_iface_mac(iface)
+        key = (src_mac, src_lla, iface, real_mac)
+        template = self._withdrawals.get(key)
+        if template is None:
+            template = build_withdrawal("00:00:00:00:00:00", src_mac, src_lla, real_mac=real_mac, iface=iface)
+            with self._lock:
+                if len(self._withdrawals) >= 1024:
+                    self._withdrawals.clear()
+                self._withdrawals[key] = template
+        return mac_to_bytes(dst_mac) + template[6:]
+
+    def invalidate(self, dst_mac: Optional[str] = None):
+        """使单个设备（或全部）的缓存失效"""
+        with self._lock:
+            if dst_mac is None:
+                self._frames.clear()
+                self._templates.clear()
+                self._withdrawals.clear()
+            else:
+                self._frames.pop(dst_mac, None)
+
+    def prune(self, active_macs):
+        """清理已不存在的设备"""
+        active = set(active_macs)
+        with self._lock:
+            for mac in [m for m in self._frames if m not in active]:
+                del self._frames[mac]
+            in_use = {key[1:] for key, _ in self._frames.values()}
+            for template_key in [k for k in self._templates if k not in in_use]:
+                del self._templates[template_key]
+
+    def __len__(self):
+        return len(self._frames)
+
+
+frame_cache = FrameCache()
@@ -0,0 +1,145 @@
+import hashlib
+import heapq
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from config import RA_interval, RA_JITTER, RA_MAX_PPS, RA_TICK
+from events import event_bus
+from metrics import ra_skipped_total
+from plan import plan
+from presence import presence
+from rawsock import send_grouped, senders
+
+logger = logging.getLogger(__name__)
+
+
+def _mac_offset(mac: str) -> float:
+    """根据 MAC 得到 [0, 1) 内稳定分布的偏移"""
+    digest = hashlib.blake2b(mac.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+class StaggeredScheduler:
+    """
+    错峰 RA 调度：每个设备有自己的下次发送时间，均匀分布在所属标签的发送间隔（默认 RA_interval）内，
+    由小顶堆维护；每次 tick 只发送已到期的设备，并受全局每秒发包数限制。
+    """
+
+    def __init__(self, interval: float = RA_interval, max_pps: int = RA_MAX_PPS,
+                 jitter: float = RA_JITTER):
+        self.interval = interval
+        self.max_pps = max_pps
+        self.jitter = jitter
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+        self._plan_version = None
+        self._tokens = float(self._capacity())
+        self._last_tick = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _capacity(self) -> float:
+        return max(1.0, self.max_pps * RA_TICK)
+
+    def _push(self, mac: str, due: float):
+        self._due[mac] = due
+        heapq.heappush(self._heap, (due, mac))
+
+    def _jitter(self, interval: float) -> float:
+        return random.uniform(-self.jitter, self.jitter) * interval
+
+    def _interval(self, mac: str) -> float:
+        entry = plan.entries.get(mac)
+        tag = plan.tags.get(entry.tag_id) if entry else None
+        return (tag.ra_interval if tag else None) or self.interval
+
+    def _sync(self, now: float):
+        """与通告计划同步：新设备加入堆，已删除的设备惰性丢弃"""
+        if self._plan_version == plan.version:
+            return
+        self._plan_version = plan.version
+        macs = set(plan.macs())
+        new_macs = [mac for mac in macs if mac not in self._due]
+        for mac in [mac for mac in self._due if mac not in macs]:
+            del self._due[mac]
+
+        if not self._heap and new_macs:
+            # 首次加载：各发送间隔的设备按顺序均匀铺满各自的周期
+            by_interval: Dict[float, List[str]] = {}
+            for mac in new_macs:
+                by_interval.setdefault(self._interval(mac), []).append(mac)
+            for interval, group in by_interval.items():
+                slot = interval / len(group)
+                for i, mac in enumerate(sorted(group, key=_mac_offset)):
+                    self._push(mac, now + i * slot + random.uniform(0, slot))
+        else:
+            # 新增设备尽快发送首个 RA，之后按哈希偏移分散
+            for mac in new_macs:
+                self._push(mac, now + _mac_offset(mac) * min(self._interval(mac), RA_TICK * 5))
+
+    def tick(self):
+        if not senders.allowed():
+            # 主备模式下的备机
+            return None
+        plan.expire_deprecated()
+        plan.refresh_iface_macs()
+        now = time.monotonic()
+        with self._lock:
+            self._sync(now)
+            if self.max_pps > 0:
+                self._tokens = min(self._capacity(), self._tokens + (now - self._last_tick) * self.max_pps)
+            self._last_tick = now
+
+            groups = {}
+            skipped = 0
+            while self._heap and self._heap[0][0] <= now:
+                if self.max_pps > 0 and self._tokens < 1:
+                    break
+                due, mac = heapq.heappop(self._heap)
+                if self._due.get(mac) != due:
+                    continue
+                entry = plan.entries.get(mac)
+                if entry is None:
+                    del self._due[mac]
+                    continue
+                interval = self._interval(mac)
+                if not presence.due(mac, now, interval):
+                    # 离线设备本周期不发送，也不消耗令牌
+                    skipped += 1
+                    self._push(mac, due + interval + self._jitter(interval))
+                    continue
+                groups.setdefault((entry.iface, entry.tag_id, entry.gateway_mac), []).append(entry.frame)
+                self._tokens -= 1
+                self._push(mac, max(due + interval + self._jitter(interval), now + RA_TICK))
+
+        if skipped:
+            ra_skipped_total.inc(skipped, trigger="periodic")
+        if not groups:
+            return None
+        result = send_grouped(groups, trigger="periodic")
+        result.skipped = skipped
+        event_bus.publish("pass", mode="staggered", sent=result.sent, failed=result.failed, skipped=skipped,
+                          duration=result.duration)
+        if result.failed:
+            logger.error(f"错峰发送：成功 {result.sent}，失败 {result.failed}")
+        return result
+
+    def trigger_now(self):
+        """所有设备立即到期（仍受每秒发包数限制）"""
+        now = time.monotonic()
+        with self._lock:
+            self._sync(now)
+            macs = list(self._due)
+            self._heap = []
+            for mac in sorted(macs, key=_mac_offset):
+                self._push(mac, now)
+
+    def pending(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for due in self._due.values() if due <= now)
+
+
+staggered = StaggeredScheduler()
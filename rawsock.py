@@ -0,0 +1,282 @@
+import ctypes
+import logging
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional
+
+from config import IFACE
+from metrics import ra_sent_total, ra_failed_total
+
+logger = logging.getLogger(__name__)
+
+ETH_P_IPV6 = 0x86DD
+SO_ATTACH_FILTER = 26
+
+
+@dataclass
+class BatchResult:
+    sent: int = 0
+    failed: int = 0
+    duration: float = 0.0
+    # 在线检测判定为离线、本轮未发送的设备数
+    skipped: int = 0
+
+
+class RawSender:
+    """
+    常驻的二层发包器：为网卡保持一个已绑定的套接字，整轮帧一次性批量发送。
+    Linux 下直接使用 AF_PACKET，其他平台退回到常驻的 scapy L2socket。
+    """
+
+    def __init__(self, iface: str = IFACE):
+        self.iface = iface
+        self._sock = None
+        self._send = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if hasattr(socket, "AF_PACKET"):
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+            sock.bind((self.iface, 0))
+            self._sock = sock
+            self._send = sock.send
+        else:
+            from scapy.config import conf as scapy_conf
+            from scapy.packet import Raw
+            sock = scapy_conf.L2socket(iface=self.iface)
+            self._sock = sock
+            self._send = lambda frame: sock.send(Raw(frame))
+        logger.info(f"已在网卡 {self.iface} 上打开发包套接字")
+
+    def ensure_open(self):
+        """打开发包套接字（若尚未打开），失败时抛出 OSError；用于启动检查，同时为首轮发送预热"""
+        with self._lock:
+            if self._sock is None:
+                self._open()
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    self._sock.close()
+                finally:
+                    self._sock = None
+                    self._send = None
+
+    def send_batch(self, frames: Iterable[bytes]) -> BatchResult:
+        """批量发送，返回本批次的成功/失败计数"""
+        result = BatchResult()
+        start = time.perf_counter()
+        with self._lock:
+            if self._sock is None:
+                try:
+                    self._open()
+                except OSError as e:
+                    logger.error(f"打开网卡 {self.iface} 的发包套接字失败: {e}")
+                    result.failed = sum(1 for _ in frames)
+                    return result
+            send = self._send
+            last_error: Optional[OSError] = None
+            for frame in frames:
+                try:
+                    send(frame)
+                    result.sent += 1
+                except OSError as e:
+                    result.failed += 1
+                    last_error = e
+            if last_error is not None:
+                logger.error(f"本批次 {result.failed} 个帧发送失败: {last_error}")
+                # 网卡可能被重建，下一批次重新打开套接字
+                self._sock.close()
+                self._sock = None
+                self._send = None
+        result.duration = time.perf_counter() - start
+        return result
+
+    def send(self, frame: bytes) -> bool:
+        return self.send_batch((frame,)).sent == 1
+
+
+class PcapSender:
+    """
+    与 RawSender 接口相同，但把帧写入 pcap 文件（或丢弃），用于没有真实网卡时的测试与基准
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        self._file = open(self.path, "wb")
+        # pcap 全局头：链路类型 1 (Ethernet)
+        self._file.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def send_batch(self, frames: Iterable[bytes]) -> BatchResult:
+        result = BatchResult()
+        start = time.perf_counter()
+        with self._lock:
+            if self.path is None:
+                result.sent = sum(1 for _ in frames)
+            else:
+                if self._file is None:
+                    self._open()
+                now = time.time()
+                sec, usec = int(now), int((now % 1) * 1_000_000)
+                write = self._file.write
+                for frame in frames:
+                    write(struct.pack("<IIII", sec, usec, len(frame), len(frame)))
+                    write(frame)
+                    result.sent += 1
+        result.duration = time.perf_counter() - start
+        return result
+
+    def send(self, frame: bytes) -> bool:
+        return self.send_batch((frame,)).sent == 1
+
+
+sender = RawSender()
+
+
+class SenderPool:
+    """
+    每个网卡一个发包器和一个专属工作线程：同一网卡上的批次串行发送，不同网卡并行，
+    某个 VLAN 的设备数量不会拖慢其他 VLAN 的发送。默认网卡使用模块级 sender。
+    """
+
+    def __init__(self, factory: Callable[[str], object] = RawSender):
+        self.factory = factory
+        # 发送闸门：返回 False 时不发送任何 RA（主备模式下的备机，或租约已失效的主机）
+        self.gate: Optional[Callable[[], bool]] = None
+        # 每组发送后的回调 on_batch(网卡, tag_id, 网关MAC, 触发原因, 帧, 是否全部成功)，用于记录发送历史
+        self.on_batch: Optional[Callable] = None
+        self._senders: Dict[str, object] = {}
+        self._workers: Dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def allowed(self) -> bool:
+        return self.gate is None or self.gate()
+
+    def get(self, iface: str = IFACE):
+        if iface == IFACE:
+            return sender
+        with self._lock:
+            s = self._senders.get(iface)
+            if s is None:
+                s = self._senders[iface] = self.factory(iface)
+            return s
+
+    def _worker(self, iface: str) -> ThreadPoolExecutor:
+        with self._lock:
+            worker = self._workers.get(iface)
+            if worker is None:
+                worker = self._workers[iface] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"sender-{iface}")
+            return worker
+
+    def _send_iface(self, iface: str, groups: dict, trigger: str) -> BatchResult:
+        total = BatchResult()
+        start = time.perf_counter()
+        iface_sender = self.get(iface)
+        on_batch = self.on_batch
+        for (tag_id, gateway_mac), frames in groups.items():
+            result = iface_sender.send_batch(frames)
+            if on_batch is not None:
+                try:
+                    on_batch(iface, tag_id, gateway_mac, trigger, frames, not result.failed)
+                except Exception as e:
+                    # 记录历史失败不影响本轮发送与计数
+                    logger.error(f"发送回调执行失败: {e}")
+            total.sent += result.sent
+            total.failed += result.failed
+            if result.sent:
+                ra_sent_total.inc(result.sent, tag=tag_id, gateway=gateway_mac, trigger=trigger)
+            if result.failed:
+                ra_failed_total.inc(result.failed, tag=tag_id, gateway=gateway_mac, trigger=trigger)
+        total.duration = time.perf_counter() - start
+        return total
+
+    def send_grouped(self, groups: dict, trigger: str) -> BatchResult:
+        if not self.allowed():
+            return BatchResult()
+        by_iface: Dict[str, dict] = {}
+        for (iface, tag_id, gateway_mac), frames in groups.items():
+            by_iface.setdefault(iface, {})[(tag_id, gateway_mac)] = frames
+        start = time.perf_counter()
+        if len(by_iface) == 1:
+            # 单网卡时直接在调用线程中发送，省去线程切换
+            (iface, iface_groups), = by_iface.items()
+            total = self._send_iface(iface, iface_groups, trigger)
+        else:
+            futures = [self._worker(iface).submit(self._send_iface, iface, iface_groups, trigger)
+                       for iface, iface_groups in by_iface.items()]
+            total = BatchResult()
+            for future in futures:
+                result = future.result()
+                total.sent += result.sent
+                total.failed += result.failed
+        total.duration = time.perf_counter() - start
+        return total
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, {}
+            senders, self._senders = self._senders, {}
+        for worker in workers.values():
+            worker.shutdown(wait=True)
+        for s in senders.values():
+            s.close()
+        sender.close()
+
+
+senders = SenderPool()
+
+
+def send_grouped(groups: dict, trigger: str) -> BatchResult:
+    """
+    按 (网卡, tag_id, 网关MAC) 分组批量发送，并按组记录发送/失败计数
+    """
+    return senders.send_grouped(groups, trigger)
+
+
+def icmpv6_filter(icmp_type: int) -> list:
+    """
+    经典 BPF：仅接收指定类型的 ICMPv6（不含扩展头）
+    等价于 tcpdump 'ip6 and ip6[6] == 58 and ip6[40] == icmp_type'
+    """
+    return [
+        (0x28, 0, 0, 12),            # ldh [12]            以太网类型
+        (0x15, 0, 5, ETH_P_IPV6),    # jeq #0x86dd
+        (0x30, 0, 0, 20),            # ldb [20]            IPv6 next header
+        (0x15, 0, 3, 58),            # jeq #58             ICMPv6
+        (0x30, 0, 0, 54),            # ldb [54]            ICMPv6 type
+        (0x15, 0, 1, icmp_type),     # jeq #icmp_type
+        (0x06, 0, 0, 0x40000),       # ret #262144
+        (0x06, 0, 0, 0),             # ret #0
+    ]
+
+
+def open_listener(iface: str, icmp_type: int, timeout: float = 1.0) -> socket.socket:
+    """打开只接收指定 ICMPv6 类型的 AF_PACKET 套接字，过滤在内核中完成"""
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_IPV6))
+    program = icmpv6_filter(icmp_type)
+    buf = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *ins) for ins in program))
+    fprog = struct.pack("HL", len(program), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    sock.bind((iface, ETH_P_IPV6))
+    sock.settimeout(timeout)
+    return sock
+
+
+def format_mac(raw: bytes) -> str:
+    return ":".join(f"{b:02x}" for b in raw)
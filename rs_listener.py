@@ -0,0 +1,183 @@
+import logging
+import socket
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from config import IFACE, RS_MIN_INTERVAL
+from events import event_bus
+from history import history
+from metrics import rs_response_seconds, ra_sent_total, ra_failed_total, LogSampler
+from plan import plan
+from presence import presence
+from rawsock import senders, open_listener, format_mac
+
+logger = logging.getLogger(__name__)
+log_sampler = LogSampler()
+
+ICMPV6_RS = 133
+
+# RS -> RA 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class RSStats:
+    def __init__(self):
+        self.received = 0
+        self.answered = 0
+        self.unknown = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency: float):
+        self.answered += 1
+        self.latency_sum += latency
+        self.latency_last = latency
+        self.latency_max = max(self.latency_max, latency)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "answered": self.answered,
+            "unknown": self.unknown,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+            "latency": {
+                "last": self.latency_last,
+                "max": self.latency_max,
+                "avg": self.latency_sum / self.answered if self.answered else 0.0,
+                "buckets": {
+                    **{str(b): n for b, n in zip(LATENCY_BUCKETS, self.buckets)},
+                    "+Inf": self.buckets[-1],
+                },
+            },
+        }
+
+
+class RSListener:
+    """
+    监听网卡上的 Router Solicitation（内核 BPF 过滤 ICMPv6 type 133），
+    来自已登记设备的 RS 立即回复该设备专属的单播 RA，并按 MAC 限速。
+    每个网卡一个监听线程。
+    """
+
+    def __init__(self, min_interval: float = RS_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.stats = RSStats()
+        self._last_answer: Dict[str, float] = {}
+        self._stops: Dict[str, threading.Event] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        # sync 可能同时由多个 CRUD 请求线程调用
+        self._threads_lock = threading.Lock()
+        # 只有 start 之后 sync 才会启动线程（配置关闭或平台不支持时保持停止）
+        self._started = False
+
+    @property
+    def ifaces(self):
+        return sorted(self._threads)
+
+    def start(self, ifaces: Optional[Iterable[str]] = None):
+        if not hasattr(socket, "AF_PACKET"):
+            logger.warning("当前平台不支持 AF_PACKET，RS 监听未启动")
+            return
+        self._started = True
+        self.sync(ifaces or [IFACE])
+
+    def sync(self, ifaces: Iterable[str]):
+        """按网卡列表启动新的监听线程，停止已不再使用的网卡上的线程"""
+        if not self._started or not hasattr(socket, "AF_PACKET"):
+            return
+        ifaces = set(ifaces)
+        with self._threads_lock:
+            for iface in [i for i in self._threads if i not in ifaces]:
+                self._stop_iface(iface)
+            # 启动失败（如网卡尚未创建）而退出的线程会在下次同步时重试
+            running = {i for i, t in self._threads.items() if t.is_alive()}
+            for iface in ifaces - running:
+                stop = self._stops[iface] = threading.Event()
+                thread = self._threads[iface] = threading.Thread(
+                    target=self._run, args=(iface, stop), name=f"rs-listener-{iface}", daemon=True)
+                thread.start()
+
+    def _stop_iface(self, iface: str):
+        self._stops.pop(iface).set()
+        self._threads.pop(iface).join(timeout=2)
+
+    def stop(self):
+        self._started = False
+        with self._threads_lock:
+            for iface in list(self._threads):
+                self._stop_iface(iface)
+
+    def _run(self, iface: str, stop: threading.Event):
+        try:
+            sock = open_listener(iface, ICMPV6_RS)
+        except OSError as e:
+            logger.error(f"网卡 {iface} 上的 RS 监听启动失败: {e}")
+            return
+        logger.info(f"已在网卡 {iface} 上监听 Router Solicitation")
+        with sock:
+            while not stop.is_set():
+                try:
+                    frame = sock.recv(2048)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    logger.error(f"RS 监听接收失败: {e}")
+                    time.sleep(1)
+                    continue
+                self.handle(frame, time.perf_counter())
+
+    def handle(self, frame: bytes, received_at: float):
+        self.stats.received += 1
+        mac = format_mac(frame[6:12])
+        entry = plan.find(mac)
+        if entry is None:
+            self.stats.unknown += 1
+            return
+        if presence.enabled:
+            # 下面会直接回复 RA，无需再由在线检测补发
+            presence.seen(mac, announce=False)
+        if not senders.allowed():
+            return
+
+        now = time.monotonic()
+        last = self._last_answer.get(mac)
+        if last is not None and now - last < self.min_interval:
+            self.stats.rate_limited += 1
+            return
+        self._last_answer[mac] = now
+        if len(self._last_answer) > 4 * max(len(plan.entries), 256):
+            self._prune(now)
+
+        ok = senders.get(entry.iface).send(entry.frame)
+        history.record_frames(entry.iface, entry.tag_id, entry.gateway_mac, "rs", (entry.frame,), ok)
+        event_bus.publish("ra", mac=entry.mac, iface=entry.iface, tag=entry.tag_id, gateway=entry.gateway_mac,
+                          trigger="rs", ok=ok)
+        if ok:
+            latency = time.perf_counter() - received_at
+            self.stats.observe(latency)
+            rs_response_seconds.observe(latency)
+            ra_sent_total.inc(tag=entry.tag_id, gateway=entry.gateway_mac, trigger="rs")
+            if logger.isEnabledFor(logging.DEBUG) and log_sampler():
+                logger.debug("[+] 收到 %s 的 RS，已立即回复 RA，网关指向 %s", mac, entry.gateway_lla)
+        else:
+            self.stats.failed += 1
+            ra_failed_total.inc(tag=entry.tag_id, gateway=entry.gateway_mac, trigger="rs")
+
+    def _prune(self, now: float):
+        for mac in [m for m, t in self._last_answer.items() if now - t >= self.min_interval]:
+            del self._last_answer[mac]
+
+
+rs_listener = RSListener()
@@ -0,0 +1,44 @@
+import sys
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+# 进程启动（首次导入本模块）的时间点
+_T0 = time.perf_counter()
+
+
+class StartupProfile:
+    """
+    启动阶段计时：记录每个阶段的耗时及新导入的模块数，--startup-profile 时输出报告。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.phases: List[Tuple[str, float, float, int]] = []  # (名称, 开始, 耗时, 新导入模块数)
+        self._reported = False
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        modules = len(sys.modules)
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - _T0, time.perf_counter() - start, len(sys.modules) - modules))
+
+    def mark(self, name: str):
+        """记录一个时间点（如首轮 RA 已发出）"""
+        self.phases.append((name, time.perf_counter() - _T0, 0.0, 0))
+
+    def report(self):
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        lines = [f"{'阶段':<28}{'开始(ms)':>10}{'耗时(ms)':>10}{'新模块':>8}"]
+        for name, start, duration, modules in self.phases:
+            lines.append(f"{name:<30}{start * 1000:>10.1f}{duration * 1000:>10.1f}{modules:>8}")
+        lines.append(f"{'总计':<28}{(time.perf_counter() - _T0) * 1000:>10.1f}{'':>10}{len(sys.modules):>8}")
+        print("\n".join(lines), file=sys.stderr, flush=True)
+
+
+startup = StartupProfile()
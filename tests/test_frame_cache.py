@@ -0,0 +1,62 @@
+import pytest
+
+import ra_cache
+from ra_cache import FrameCache, RAOptions, build_ra, build_withdrawal
+
+IFACE = "test0"
+REAL_MAC = "02:00:00:00:00:aa"
+GATEWAY = ("0a:00:00:00:00:01", "fe80::1")
+DNS = ["2001:db8::53"]
+
+
+@pytest.fixture(autouse=True)
+def iface_mac(monkeypatch):
+    monkeypatch.setattr(ra_cache, "_iface_macs", {IFACE: REAL_MAC})
+    monkeypatch.setattr(ra_cache, "_iface_mac_failed_at", {})
+
+
+def _full(dst_mac, **kwargs):
+    return build_ra(dst_mac, "ff02::1", *GATEWAY, DNS, 1800, real_mac=REAL_MAC, **kwargs)
+
+
+def test_template_frames_match_full_build():
+    """模板替换目的 MAC 得到的帧与逐个设备用 scapy 构造的帧逐字节相同"""
+    cache = FrameCache()
+    options = RAOptions(managed=True, mtu=1500, routes=("2001:db8:100::/48",))
+    for mac in ("aa:bb:cc:00:00:01", "aa:bb:cc:00:00:02", "AA-BB-CC-00-00-03"):
+        frame = cache.get(mac, *GATEWAY, DNS, 1800, prefix="2001:db8::", iface=IFACE, options=options)
+        assert frame == _full(mac.replace("-", ":").lower(), prefix="2001:db8::", options=options)
+    assert cache.misses == 3 and len(cache._templates) == 1
+
+
+def test_key_change_rebuilds_and_steady_state_hits():
+    cache = FrameCache()
+    first = cache.get("aa:bb:cc:00:00:01", *GATEWAY, DNS, 1800, iface=IFACE)
+    assert cache.get("aa:bb:cc:00:00:01", *GATEWAY, DNS, 1800, iface=IFACE) is first
+    assert cache.hits == 1
+    changed = cache.get("aa:bb:cc:00:00:01", *GATEWAY, ["2001:db8::54"], 1800, iface=IFACE)
+    assert changed != first and cache.misses == 2
+
+
+def test_withdrawal_template_matches_full_build():
+    cache = FrameCache()
+    frame = cache.withdrawal("AA-BB-CC-00-00-01", *GATEWAY, iface=IFACE)
+    assert frame == build_withdrawal("aa:bb:cc:00:00:01", *GATEWAY, real_mac=REAL_MAC)
+
+
+def test_iface_mac_resolution_is_retried_with_backoff(monkeypatch):
+    calls = []
+
+    def hwaddr(iface):
+        calls.append(iface)
+        raise OSError("no such device")
+
+    monkeypatch.setattr(ra_cache, "get_if_hwaddr", hwaddr)
+    assert ra_cache.get_iface_mac("missing0") is None
+    assert ra_cache.get_iface_mac("missing0") is None
+    assert calls == ["missing0"]
+
+    monkeypatch.setattr(ra_cache, "get_if_hwaddr", lambda iface: REAL_MAC)
+    ra_cache._iface_mac_failed_at["missing0"] -= ra_cache.IFACE_MAC_RETRY
+    assert ra_cache.resolve_pending_iface_macs() == ["missing0"]
+    assert ra_cache.get_iface_mac("missing0") == REAL_MAC
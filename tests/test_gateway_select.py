@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+from gateway_select import select_gateway, _remap_ratio
+
+DEVICES = [f"02:00:00:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}" for i in range(20000)]
+
+
+@dataclass
+class GW:
+    mac: str
+    weight: int = 1
+
+
+def _gateways(n):
+    return [GW(f"0a:00:00:00:00:{i:02x}") for i in range(n)]
+
+
+def _shares(gateways):
+    counts = {}
+    for mac in DEVICES:
+        gw = select_gateway(mac, gateways).mac
+        counts[gw] = counts.get(gw, 0) + 1
+    return {gw: n / len(DEVICES) for gw, n in counts.items()}
+
+
+def test_stable_and_mac_format_independent():
+    gateways = _gateways(5)
+    for mac in DEVICES[:100]:
+        gw = select_gateway(mac, gateways)
+        assert select_gateway(mac, list(reversed(gateways))) is gw
+        assert select_gateway(mac.upper().replace(":", "-"), gateways) is gw
+
+
+def test_add_gateway_moves_about_one_in_n():
+    before = _gateways(5)
+    after = before + [GW("0a:00:00:00:00:ff")]
+    ratio = _remap_ratio(DEVICES, before, after, select_gateway)
+    assert abs(ratio - 1 / 6) < 0.02
+    # 迁移的设备都转到新网关
+    for mac in DEVICES[:2000]:
+        old, new = select_gateway(mac, before), select_gateway(mac, after)
+        assert new is old or new is after[-1]
+
+
+def test_remove_gateway_moves_only_its_devices():
+    before = _gateways(5)
+    removed = before[2]
+    after = before[:2] + before[3:]
+    ratio = _remap_ratio(DEVICES, before, after, select_gateway)
+    assert abs(ratio - 1 / 5) < 0.02
+    for mac in DEVICES[:2000]:
+        old = select_gateway(mac, before)
+        if old is not removed:
+            assert select_gateway(mac, after) is old
+
+
+def test_weights_are_honored():
+    gateways = _gateways(4) + [GW("0a:00:00:00:00:04", weight=4)]
+    shares = _shares(gateways)
+    for gw in gateways:
+        assert abs(shares[gw.mac] - gw.weight / 8) < 0.02
+
+
+def test_zero_weight_and_empty():
+    gateways = _gateways(3) + [GW("0a:00:00:00:00:03", weight=0)]
+    assert "0a:00:00:00:00:03" not in _shares(gateways)
+    assert select_gateway(DEVICES[0], []) is None
+    assert select_gateway(DEVICES[0], [GW("0a:00:00:00:00:00", weight=0)]) is None
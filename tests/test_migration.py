@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+from sqlmodel import Session, create_engine, select
+
+from data import database
+from models import Tag
+
+# 引入按标签参数之前的表结构
+OLD_SCHEMA = """
+CREATE TABLE tags (tag_id INTEGER NOT NULL PRIMARY KEY, alias VARCHAR NOT NULL, dns JSON);
+CREATE TABLE devices (mac VARCHAR(17) NOT NULL PRIMARY KEY, tag_id INTEGER NOT NULL REFERENCES tags (tag_id),
+                      alias VARCHAR);
+CREATE TABLE gateways (mac VARCHAR(17) NOT NULL PRIMARY KEY, tag_id INTEGER NOT NULL REFERENCES tags (tag_id),
+                       alias VARCHAR, local_ipv6 VARCHAR NOT NULL);
+INSERT INTO tags VALUES (1, 'old', '["2001:db8::53"]');
+"""
+
+
+@pytest.fixture
+def old_db(tmp_path, monkeypatch):
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(OLD_SCHEMA)
+    engine = create_engine(f"sqlite:///{path}")
+    monkeypatch.setattr(database, "engine", engine)
+    return engine
+
+
+def test_migrate_adds_tag_columns_with_defaults(old_db):
+    database.migrate_db()
+    with Session(old_db) as session:
+        tag = session.exec(select(Tag)).one()
+    assert tag.routes == []
+    assert tag.dns == ["2001:db8::53"]
+    assert tag.ra_interval is None and tag.mtu is None
+    # CRUDService 更新时的校验：迁移后的旧标签必须能通过
+    tag.alias = "renamed"
+    assert Tag.model_validate(tag.model_dump()).routes == []
+
+
+def test_migrated_gateway_weight_defaults_to_one(old_db):
+    with old_db.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO gateways VALUES ('0a:00:00:00:00:01', 1, NULL, 'fe80::1')")
+    database.migrate_db()
+    with old_db.connect() as conn:
+        assert conn.exec_driver_sql("SELECT weight FROM gateways").scalar() == 1
+
+
+def test_null_routes_from_earlier_migration_are_accepted():
+    assert Tag.model_validate({"tag_id": 1, "alias": "t", "dns": [], "routes": None}).routes == []
@@ -0,0 +1,49 @@
+import pytest
+
+import plan as plan_module
+import ra_cache
+from models import Device, Gateway, Tag
+from plan import AdvertisementPlan
+
+
+@pytest.fixture
+def plan(monkeypatch):
+    monkeypatch.setattr(ra_cache, "_iface_macs", {"test0": "02:00:00:00:00:aa"})
+    monkeypatch.setattr(ra_cache, "_iface_mac_failed_at", {})
+    p = AdvertisementPlan()
+    p.tags = {1: Tag(tag_id=1, alias="t", dns=["2001:db8::53"], iface="test0")}
+    p.gateways = {f"0a:00:00:00:00:0{i}": Gateway(mac=f"0a:00:00:00:00:0{i}", tag_id=1, local_ipv6=f"fe80::{i}")
+                  for i in (1, 2)}
+    p.devices = {f"aa:bb:cc:00:00:{i:02x}": Device(mac=f"aa:bb:cc:00:00:{i:02x}", tag_id=1) for i in range(20)}
+    return p
+
+
+def test_rebuild_does_not_touch_the_database(plan, monkeypatch):
+    def no_db(*args, **kwargs):
+        raise AssertionError("rebuild must not open a session")
+
+    monkeypatch.setattr(plan_module, "Session", no_db)
+    changes = plan.rebuild()
+    assert set(plan.entries) == set(plan.devices)
+    assert {change.mac for change in changes} == set(plan.devices)
+    assert all(entry.iface == "test0" for entry in plan.entries.values())
+
+
+def test_rebuild_reports_gateway_changes_once(plan):
+    plan.rebuild()
+    version = plan.version
+    moved = {mac for mac, entry in plan.entries.items() if entry.gateway_mac == "0a:00:00:00:00:02"}
+    plan.unhealthy.add("0a:00:00:00:00:02")
+    changes = plan.rebuild()
+    assert plan.version == version + 1
+    assert {change.mac for change in changes} == moved
+    assert all(change.new.gateway_mac == "0a:00:00:00:00:01" for change in changes)
+
+
+def test_gateway_address_change_withdraws_old_router(plan):
+    plan.rebuild()
+    gateway = plan.gateways["0a:00:00:00:00:01"]
+    served = {mac for mac, entry in plan.entries.items() if entry.gateway_mac == gateway.mac}
+    changes = plan.on_change("update", gateway.mac, Gateway(mac=gateway.mac, tag_id=1, local_ipv6="fe80::100"))
+    assert {change.mac for change in changes} == served
+    assert all(c.old.gateway_lla == "fe80::1" and c.new.gateway_lla == "fe80::100" for c in changes)
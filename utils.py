@@ -1,82 +1,202 @@
-from collections import defaultdict
-from typing import List
+import datetime
+import threading
+import time
+from typing import Dict, List
 
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.background import BackgroundScheduler
-from scapy.layers.inet6 import ICMPv6ND_RA, ICMPv6NDOptPrefixInfo, ICMPv6NDOptSrcLLAddr, IPv6, ICMPv6NDOptRDNSS
-from scapy.layers.l2 import Ether
-from scapy.sendrecv import sendp
-from sqlmodel import Session, select
+from apscheduler.triggers.interval import IntervalTrigger
 
-from config import PREFIX, IFACE, RA_lifetime, RA_interval
-from data.database import engine
-from models import Device, Gateway, Tag
+from config import PREFIX, RA_interval, RA_SCHEDULE_MODE, RA_TICK, RETARGET_DELAY
+from events import event_bus
+from metrics import daemon_pass_seconds, plan_devices, scheduler_lag_seconds, ra_skipped_total, pass_devices, \
+    LogSampler
+from plan import plan, PlanChange
+from presence import presence
+from ra_cache import build_ra, frame_cache, RAOptions, DEFAULT_RA_OPTIONS
+from ra_scheduler import staggered
+from rawsock import sender, senders, send_grouped, BatchResult
 
 import logging
 logger = logging.getLogger(__name__)
+log_sampler = LogSampler()
 
 
-def send_ra(dst_mac, dst_lla, src_mac, src_lla,dns: List[str], router_lifetime: int, real_mac=None):
+def send_ra(dst_mac, dst_lla, src_mac, src_lla,dns: List[str], router_lifetime: int, real_mac=None,
+            prefix=PREFIX, options: RAOptions = DEFAULT_RA_OPTIONS):
     if not dst_mac:
         logger.error(f"[-] 向 {dst_mac}  发送 RA 失败，未能找到设备的ipv6")
-    # 构造以太网头
-    eth = Ether(src=real_mac, dst=dst_mac)
-    #print(eth)
-    # 构造IPv6头：伪造源LLA
-    ip6 = IPv6(src=src_lla, dst=dst_lla)
-    # 构造RA报文
-    ra = ICMPv6ND_RA(chlim=64, M=0, O=0)
-    # 构造前缀信息
-    pref = ICMPv6NDOptPrefixInfo(
-        prefix=PREFIX,
-        prefixlen=64,
-        L=1, #链路内标志
-        A=1, #自主地址配置标志
-        validlifetime=router_lifetime,
-        preferredlifetime=router_lifetime
-    )
-    sll = ICMPv6NDOptSrcLLAddr(lladdr=src_mac)
-    rdnss = ICMPv6NDOptRDNSS(dns=dns, lifetime=router_lifetime)
-    pkt = eth / ip6 / ra / pref / sll / rdnss
-    sendp(pkt, iface=IFACE, verbose=False)
-    logger.info(f"[+] 已向 {dst_mac} ({dst_lla}) 发送 RA，网关指向 {src_lla}，DNS为{dns}")
-
-def daemon():
-    with Session(engine) as session:
-        # 1. 查询所有设备
-        devices = session.exec(select(Device)).all()
-
-        # 2. 查询所有 Gateway 并按 tag_id 分组
-        gateways = session.exec(select(Gateway)).all()
-        tag_gateways = defaultdict(list)
-        for gw in gateways:
-            tag_gateways[gw.tag_id].append(gw)
-
-        # 3. 查询所有 Tag 并按 tag_id 索引
-        tags = session.exec(select(Tag)).all()
-        tag_dict = {tag.tag_id: tag for tag in tags}
-
-        # 4. 为每个设备分配 Gateway 并发送 RA
-        for device in devices:
-            gateways_list = tag_gateways.get(device.tag_id, [])
-            if not gateways_list:
-                continue
-
-            # 获取该设备所在 tag 的 DNS
-            tag = tag_dict.get(device.tag_id)
-            dns_servers = tag.dns if tag else []
-
-            # MAC 地址哈希负载均衡
-            mac_int = int(device.mac.replace(':', '').replace('-', '').lower(), 16)
-            gateway = gateways_list[mac_int % len(gateways_list)]
-
-            send_ra(
-                dst_mac=device.mac,
-                dst_lla="ff02::1",
-                src_mac=gateway.mac,
-                src_lla=gateway.local_ipv6,
-                dns=dns_servers,  # 传递 DNS 列表
-                router_lifetime=RA_lifetime
-            )
+    pkt = build_ra(dst_mac, dst_lla, src_mac, src_lla, dns, router_lifetime, real_mac=real_mac,
+                   prefix=prefix, options=options)
+    if not sender.send(pkt):
+        logger.error(f"[-] 向 {dst_mac} 发送 RA 失败")
+        return
+    if logger.isEnabledFor(logging.DEBUG) and log_sampler():
+        logger.debug("[+] 已向 %s (%s) 发送 RA，网关指向 %s，DNS为%s", dst_mac, dst_lla, src_lla, dns)
+
+# 各标签上次周期发送的时间（burst 模式）
+_tag_last_sent: Dict[int, float] = {}
+_broadcast_tick = RA_interval
+
+def _due_tags(now: float) -> set:
+    """发送间隔已到的标签；daemon 每 _broadcast_tick 秒运行一次，提前半个 tick 以内视为到期"""
+    due = set()
+    for tag_id in {tag_id for _iface, tag_id, _gw in plan.groups()}:
+        last = _tag_last_sent.get(tag_id)
+        if last is None or now - last >= plan.tag_interval(tag_id) - _broadcast_tick / 2:
+            due.add(tag_id)
+    return due
+
+def daemon(due_only: bool = False):
+    """
+    发送一轮 RA。due_only 为 True 时（周期任务）只发送发送间隔已到的标签，否则发送全部。
+    """
+    if not senders.allowed():
+        # 主备模式下的备机
+        return None
+    # 从内存通告计划取出本轮所有帧（按标签/网关分组），热路径不访问数据库
+    start = time.perf_counter()
+    now = time.monotonic()
+    plan.expire_deprecated()
+    plan.refresh_iface_macs()
+    due = _due_tags(now) if due_only else None
+    if presence.enabled:
+        # 跳过离线设备（按退避计划偶尔发送）
+        entries = plan.snapshot()
+        if due is not None:
+            entries = [e for e in entries if e.tag_id in due]
+        groups, skipped = presence.select(entries)
+    else:
+        groups, skipped = plan.groups(), 0
+        if due is not None:
+            groups = {key: frames for key, frames in groups.items() if key[1] in due}
+    for tag_id in (due if due is not None else {key[1] for key in plan.groups()}):
+        _tag_last_sent[tag_id] = now
+    result = send_grouped(groups, trigger="periodic")
+    result.skipped = skipped
+    result.duration = time.perf_counter() - start
+    daemon_pass_seconds.observe(result.duration)
+    plan_devices.set(len(plan.entries))
+    pass_devices.set(result.sent, result="sent")
+    pass_devices.set(skipped, result="skipped")
+    if skipped:
+        ra_skipped_total.inc(skipped, trigger="periodic")
+    presence.record_pass(result.sent, skipped)
+    event_bus.publish("pass", mode="burst", sent=result.sent, failed=result.failed, skipped=skipped,
+                      duration=result.duration, due_only=due_only)
+    if result.failed:
+        logger.error(f"本轮 RA 发送完成：成功 {result.sent}，失败 {result.failed}，跳过 {skipped}，耗时 {result.duration:.3f}s")
+    else:
+        logger.info(f"本轮 RA 发送完成：共 {result.sent} 个，跳过离线设备 {skipped} 个，耗时 {result.duration:.3f}s")
+    return result
+
+def retarget(changes: List[PlanChange]):
+    """
+    网关变化的设备立即收到通知：旧网关发送 lifetime 为 0 的 RA，新网关（如有）立即发送 RA
+    """
+    withdrawals, fresh = {}, {}
+    for change in changes:
+        if change.old is not None:
+            old = change.old
+            withdrawals.setdefault((old.iface, old.tag_id, old.gateway_mac), []).append(
+                frame_cache.withdrawal(change.mac, old.gateway_mac, old.gateway_lla, iface=old.iface))
+        if change.new is not None:
+            new = change.new
+            fresh.setdefault((new.iface, new.tag_id, new.gateway_mac), []).append(new.frame)
+    if not withdrawals and not fresh:
+        return None
+    # 先撤回旧网关，再通告新网关
+    result = send_grouped(withdrawals, trigger="withdrawal")
+    announced = send_grouped(fresh, trigger="retarget")
+    result = BatchResult(sent=result.sent + announced.sent, failed=result.failed + announced.failed,
+                         duration=result.duration + announced.duration)
+    if event_bus.active:
+        for change in changes:
+            event_bus.publish("retarget", mac=change.mac,
+                              old_gateway=change.old.gateway_mac if change.old else None,
+                              new_gateway=change.new.gateway_mac if change.new else None)
+        event_bus.publish("pass", mode="retarget", sent=result.sent, failed=result.failed, skipped=0,
+                          duration=result.duration)
+    logger.info(f"已为 {len(changes)} 个设备重新指定网关：发送 {result.sent}，失败 {result.failed}")
+    return result
+
+class RetargetQueue:
+    """
+    合并 CRUD 产生的网关变化：首个变化到达后等待 delay 秒，窗口内同一设备的多次变化合并为
+    (最早的旧条目, 当前条目)，然后一次性调用 retarget，批量修改不会逐行发包。
+    """
+
+    def __init__(self, delay: float = RETARGET_DELAY):
+        self.delay = delay
+        self._pending: Dict[str, PlanChange] = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def submit(self, changes: List[PlanChange]):
+        if not changes:
+            return
+        with self._lock:
+            for change in changes:
+                if change.mac not in self._pending:
+                    self._pending[change.mac] = change
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        # 以发送时的计划为准，窗口内又改回原网关的设备无需发送
+        changes = [PlanChange(mac=mac, old=change.old, new=plan.entries.get(mac))
+                   for mac, change in pending.items()]
+        changes = [c for c in changes if c.gateway_changed]
+        if changes:
+            return retarget(changes)
+        return None
+
+
+retarget_queue = RetargetQueue()
+
+def trigger_now():
+    """立即触发一轮发送；staggered 模式下所有设备立即到期，仍受限速约束"""
+    if RA_SCHEDULE_MODE == "staggered":
+        staggered.trigger_now()
+        if broadcast_job.next_run_time is None:
+            # 周期任务已通过 /api/broadcast/stop 暂停：只运行一次，不恢复周期任务
+            scheduler.add_job(staggered.tick, id="trigger_now", replace_existing=True, misfire_grace_time=30)
+        else:
+            broadcast_job.modify(next_run_time=datetime.datetime.now())
+    else:
+        scheduler.add_job(daemon, id="trigger_now", replace_existing=True, misfire_grace_time=30)
+
+def reschedule_broadcast():
+    """burst 模式下以最短的标签发送间隔运行周期任务，各标签只在自己的间隔到期时发送"""
+    global _broadcast_tick
+    if RA_SCHEDULE_MODE == "staggered":
+        return
+    tick = min(plan.intervals())
+    if tick != _broadcast_tick:
+        _broadcast_tick = tick
+        if broadcast_job.next_run_time is None:
+            # 已暂停：只替换触发器，reschedule 会重新计算下次运行时间从而恢复任务
+            broadcast_job.modify(trigger=IntervalTrigger(seconds=tick))
+        else:
+            broadcast_job.reschedule('interval', seconds=tick)
+        logger.info(f"周期发送任务间隔调整为 {tick} 秒")
+
+def _on_job_submitted(event):
+    if event.scheduled_run_times:
+        scheduled = event.scheduled_run_times[-1]
+        lag = (datetime.datetime.now(scheduled.tzinfo) - scheduled).total_seconds()
+        scheduler_lag_seconds.observe(max(lag, 0.0), job=event.job_id)
 
 scheduler = BackgroundScheduler()
-broadcast_job = scheduler.add_job(daemon, 'interval', seconds=RA_interval,misfire_grace_time=30,coalesce=True,max_instances=1)
\ No newline at end of file
+scheduler.add_listener(_on_job_submitted, EVENT_JOB_SUBMITTED)
+if RA_SCHEDULE_MODE == "staggered":
+    broadcast_job = scheduler.add_job(staggered.tick, 'interval', seconds=RA_TICK,misfire_grace_time=RA_TICK,coalesce=True,max_instances=1)
+else:
+    broadcast_job = scheduler.add_job(daemon, 'interval', seconds=RA_interval,kwargs={"due_only": True},misfire_grace_time=30,coalesce=True,max_instances=1)
\ No newline at end of file
@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.responses import FileResponse, Response
+
+from config import WEBUI_ROOT_DIR
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vite 构建输出目录（build.assetsDir）下带内容哈希的文件名（如 assets/index-B4f3a9c1.js），
+# 内容变化时文件名随之变化，可长期缓存；public 目录复制来的文件（如 apple-touch-icon.png）不带哈希
+ASSETS_DIR = "assets/"
+HASHED_NAME = re.compile(r"[-.]([A-Za-z0-9_-]{8,})\.[a-z0-9]+$")
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml",
+                "application/manifest+json", "application/wasm")
+MIN_COMPRESS_SIZE = 1024
+MAX_CACHED_FILE = 16 * 1024 * 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+@dataclass
+class Asset:
+    body: bytes
+    media_type: str
+    etag: str
+    cache_control: str
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+
+def _is_hashed(key: str) -> bool:
+    """是否为 Vite 输出的带哈希文件：位于 assets/ 下，且文件名末尾的标记含数字或大写字母（排除 logo-dashboard.svg 之类）"""
+    if not key.startswith(ASSETS_DIR):
+        return False
+    match = HASHED_NAME.search(key)
+    return match is not None and any(c.isdigit() or c.isupper() for c in match.group(1))
+
+
+def _compressible(media_type: str) -> bool:
+    return media_type.startswith(COMPRESSIBLE)
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class AssetIndex:
+    """
+    WebUI 静态文件的内存索引：启动时（及 WebUI 更新后）读入 dist 目录下的全部文件，
+    预先计算强 ETag 及 gzip/brotli 压缩版本；请求时不再访问文件系统。
+    带哈希的文件使用 immutable 长期缓存，其余文件（如 index.html）每次协商缓存。
+    """
+
+    def __init__(self, root: Path = WEBUI_ROOT_DIR):
+        self.root = root
+        self._assets: Dict[str, Asset] = {}
+        # 过大而不放入内存的文件，直接从磁盘发送
+        self._large: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        assets: Dict[str, Asset] = {}
+        large: Dict[str, Path] = {}
+        raw_size = 0
+        if self.root.is_dir():
+            for path in sorted(self.root.rglob("*")):
+                if not path.is_file():
+                    continue
+                key = path.relative_to(self.root).as_posix()
+                if path.stat().st_size > MAX_CACHED_FILE:
+                    large[key] = path
+                    continue
+                body = path.read_bytes()
+                raw_size += len(body)
+                assets[key] = self._build(key, body)
+        with self._lock:
+            self._assets = assets
+            self._large = large
+        logger.info(f"WebUI 静态文件已索引：{len(assets)} 个文件，{raw_size // 1024} KB")
+
+    @staticmethod
+    def _build(name: str, body: bytes) -> Asset:
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        asset = Asset(
+            body=body,
+            media_type=media_type,
+            etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+            cache_control=IMMUTABLE if _is_hashed(name) else REVALIDATE,
+        )
+        if len(body) >= MIN_COMPRESS_SIZE and _compressible(media_type):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                asset.gzip = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    asset.br = compressed
+        return asset
+
+    def get(self, path: str) -> Optional[Asset]:
+        return self._assets.get(path)
+
+    def __len__(self):
+        return len(self._assets) + len(self._large)
+
+    def response(self, path: str, headers) -> Optional[Response]:
+        """返回 path 对应的响应；path 不存在时返回 None"""
+        asset = self._assets.get(path)
+        if asset is None:
+            large = self._large.get(path)
+            return FileResponse(large) if large is not None else None
+
+        # 不同编码是不同的表示，ETag 需加以区分
+        body, encoding, etag = asset.body, None, asset.etag
+        accept_encoding = headers.get("accept-encoding", "")
+        if asset.br is not None and _accepts(accept_encoding, "br"):
+            body, encoding, etag = asset.br, "br", asset.etag[:-1] + '-br"'
+        elif asset.gzip is not None and _accepts(accept_encoding, "gzip"):
+            body, encoding, etag = asset.gzip, "gzip", asset.etag[:-1] + '-gz"'
+
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in
+                              [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=response_headers)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.media_type, headers=response_headers)
+
+
+asset_index = AssetIndex()
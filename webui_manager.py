@@ -1,4 +1,9 @@
 import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
 import httpx
 import zipfile
 import json
@@ -6,16 +11,33 @@ import json
 import asyncio
 
 from config import WEBUI_DIR,VERSION_FILE,GITHUB_REPO
+from webui_assets import asset_index
 
 logger = logging.getLogger(__name__)
 
-async def get_latest_release():
-    """获取最新 release 信息"""
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def get_latest_release(etag=None, last_modified=None):
+    """
+    获取最新 release 信息；传入上次的 ETag/Last-Modified 时发送条件请求，
+    未变化（304）时返回 None
+    """
     url = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
     async with httpx.AsyncClient() as client:
-        response = await client.get(url)
+        response = await client.get(url, headers=headers)
+        if response.status_code == 304:
+            return None
         response.raise_for_status()
-        return response.json()
+        release = response.json()
+        release["_etag"] = response.headers.get("etag")
+        release["_last_modified"] = response.headers.get("last-modified")
+        return release
 
 
 class WebUIManager:
@@ -23,47 +45,92 @@ class WebUIManager:
         self.webui_dir = WEBUI_DIR
         self.version_file = VERSION_FILE
 
-    def get_local_version(self):
-        """获取本地版本"""
+    def get_local_info(self) -> dict:
+        """本地版本信息（版本号及上次检查时的 ETag/Last-Modified）"""
         if self.version_file.exists():
             with open(self.version_file) as f:
-                return json.load(f).get("version")
-        return None
+                return json.load(f)
+        return {}
 
-    async def download_webui(self, download_url: str, version: str):
-        """下载并解压 WebUI"""
-        logger.info(f"Downloading WebUI version {version}...")
+    def get_local_version(self):
+        """获取本地版本"""
+        return self.get_local_info().get("version")
 
-        async with httpx.AsyncClient(follow_redirects=True, timeout=60.0) as client:
-            response = await client.get(download_url)
-            response.raise_for_status()
+    def save_local_info(self, **info):
+        tmp_path = self.version_file.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self.version_file)
 
-            zip_path = self.webui_dir / "webui.zip"
-            with open(zip_path, "wb") as f:
-                f.write(response.content)
+    async def download_webui(self, download_url: str, version: str, etag=None, last_modified=None):
+        """流式下载 WebUI 到临时文件，解压到临时目录后整体替换 dist 目录"""
+        logger.info(f"Downloading WebUI version {version}...")
+
+        fd, zip_name = tempfile.mkstemp(prefix=".webui-", suffix=".zip", dir=self.webui_dir)
+        zip_path = Path(zip_name)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async with httpx.AsyncClient(follow_redirects=True, timeout=60.0) as client:
+                    async with client.stream("GET", download_url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
 
             logger.info("Extracting WebUI...")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(self.webui_dir)
+            await asyncio.to_thread(self._install, zip_path)
+        finally:
+            zip_path.unlink(missing_ok=True)
 
-            zip_path.unlink()
+        # 保存版本信息
+        self.save_local_info(version=version, etag=etag, last_modified=last_modified)
 
-            # 保存版本信息
-            with open(self.version_file, "w") as f:
-                json.dump({"version": version}, f)
+        # 重建静态文件索引（含预压缩），之后的请求使用新版本
+        await asyncio.to_thread(asset_index.load)
+        logger.info(f"WebUI {version} ready!")
 
-            logger.info(f"WebUI {version} ready!")
+    def _install(self, zip_path: Path):
+        """解压到同一文件系统下的临时目录，校验后以重命名替换 dist，不会出现解压到一半的目录"""
+        staging = Path(tempfile.mkdtemp(prefix=".extract-", dir=self.webui_dir))
+        old = self.webui_dir / ".dist-old"
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                for name in zip_ref.namelist():
+                    target = (staging / name).resolve()
+                    if not target.is_relative_to(staging.resolve()):
+                        raise ValueError(f"unsafe path in archive: {name}")
+                zip_ref.extractall(staging)
+
+            new_dist = staging / asset_index.root.name
+            if not (new_dist / "index.html").is_file():
+                raise ValueError(f"{asset_index.root.name}/index.html not found in archive")
+
+            shutil.rmtree(old, ignore_errors=True)
+            if asset_index.root.exists():
+                os.rename(asset_index.root, old)
+            os.rename(new_dist, asset_index.root)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            shutil.rmtree(old, ignore_errors=True)
 
     async def ensure_webui(self, force_update=False):
         """确保 WebUI 存在且是最新版本"""
         self.webui_dir.mkdir(parents=True, exist_ok=True)
 
         try:
-            release = await get_latest_release()
-            latest_version = release["tag_name"]
-            local_version = self.get_local_version()
+            local = self.get_local_info()
+            local_version = local.get("version")
+            installed = (asset_index.root / "index.html").exists()
+            conditional = installed and not force_update
+            release = await get_latest_release(
+                etag=local.get("etag") if conditional else None,
+                last_modified=local.get("last_modified") if conditional else None,
+            )
+            if release is None:
+                logger.info(f"WebUI is up to date (version {local_version}, not modified)")
+                return
 
-            if force_update or local_version != latest_version:
+            latest_version = release["tag_name"]
+            if force_update or not installed or local_version != latest_version:
                 # 查找 dist.zip 资源
                 asset = next(
                     (a for a in release["assets"] if a["name"] == "dist.zip"),
@@ -71,17 +138,20 @@ class WebUIManager:
                 )
 
                 if asset:
-                    await self.download_webui(asset["browser_download_url"], latest_version)
+                    await self.download_webui(asset["browser_download_url"], latest_version,
+                                              etag=release["_etag"], last_modified=release["_last_modified"])
                 else:
                     logger.warning("Warning: dist.zip not found in release assets")
             else:
+                self.save_local_info(version=local_version, etag=release["_etag"],
+                                     last_modified=release["_last_modified"])
                 logger.info(f"WebUI is up to date (version {local_version})")
 
         except Exception as e:
             logger.error(f"Error managing WebUI: {e}")
-            if not (self.webui_dir / "index.html").exists():
+            if not (asset_index.root / "index.html").exists():
                 logger.error("WebUI not available and download failed")
 
 if __name__ == "__main__":
     webui_manager = WebUIManager()
-    asyncio.run(webui_manager.ensure_webui())
\ No newline at end of file
+    asyncio.run(webui_manager.ensure_webui())